@@ -1,10 +1,3 @@
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except Exception:
-    openai = None
-    OPENAI_AVAILABLE = False
-
 # Do not hardcode API keys in source. A per-request OpenAI key is required for Auto-Validate.
 OPENAI_API_KEY = None
 
@@ -69,7 +62,10 @@ def get_gpt5_network_explanation(environment_data, mode='report', api_key=None):
     mode='report' -> well-formatted technical report (gpt-4o)
     mode='opinion' -> architecture-level opinion using GPT-4 (fallback to gpt-4o if gpt-4 fails)
     """
-    if not OPENAI_AVAILABLE:
+    # Imported on first use so workers that never call the LLM skip the SDK import cost.
+    try:
+        import openai
+    except Exception:
         return "OpenAI SDK not installed on this host. Install the 'openai' package in a virtualenv and restart the app to enable LLM features."
 
     # Require a per-request api_key for security. Do NOT persist it.
@@ -220,138 +216,76 @@ Usage:
 - Use the "Validate Hub Peerings" menu option to validate peerings for a specific VNet.
 """
 
-from flask import Flask, render_template, request, send_file, make_response
-import pdfkit
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.resource import SubscriptionClient
-from tabulate import tabulate
-from azure.mgmt.resource import ResourceManagementClient  # Import the ResourceManagementClient
+from flask import Blueprint, Flask, render_template, request, send_file, make_response, jsonify
 import json
 import os
 import logging
+import threading
+import time
+
+from inventory import collect_environment, save_environment
+from path_trace import get_trace_index
+from prefix_index import get_prefix_index
+from snapshot_model import compact_snapshot, id_key
+from validation import compute_insights, validate_routes
+from whatif import WhatIf
+
+# The Azure SDKs, pdfkit, tabulate and openai are imported inside the functions that use them.
+# They are slow to import and most requests never touch them, so keeping them out of module
+# import keeps worker cold start short on App Service scale-out (see tools/startup_benchmark.py).
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'
+ENVIRONMENT_FILE = 'environments/environment_data.json'
+
+bp = Blueprint('routevalidator', __name__)
 
-@app.route('/', methods=['GET', 'POST'])
+@bp.route('/', methods=['GET', 'POST'])
 def index():
 
     return render_template('index.html')
 
-# Global variable to store the environment data
+# Environment snapshot, parsed from ENVIRONMENT_FILE on first access (see get_environment_data).
+# Held as a read-only snapshot_model.Snapshot; the JSON file stays the source for view/download.
 environment_data = {}
+_environment_loaded = False
+_environment_lock = threading.Lock()
 
-def load_environment_data():
-    global environment_data
+def _read_environment_file():
+    global environment_data, _environment_loaded
     os.makedirs('environments', exist_ok=True)
-    file_path = 'environments/environment_data.json'
+    file_path = ENVIRONMENT_FILE
     if os.path.exists(file_path):
         with open(file_path, 'r') as f:
             try:
-                environment_data = json.load(f)
+                environment_data = compact_snapshot(json.load(f))
             except json.JSONDecodeError:
                 environment_data = {}  # Initialize with an empty dictionary if the file is empty or invalid
     else:
         environment_data = {}  # Clear the global variable if the file doesn't exist
+    _environment_loaded = True
+    return environment_data
 
-# Load the environment data when the application starts
-load_environment_data()
-
-@app.route('/load-environment', methods=['POST'])
+def load_environment_data():
+    """(Re)load the environment snapshot from disk."""
+    with _environment_lock:
+        return _read_environment_file()
+
+def get_environment_data():
+    """Return the environment snapshot, loading it from disk on first use."""
+    if not _environment_loaded:
+        with _environment_lock:
+            if not _environment_loaded:
+                _read_environment_file()
+    return environment_data
+
+@bp.route('/load-environment', methods=['POST'])
 def load_environment():
-    credential = DefaultAzureCredential()
-    subscription_client = SubscriptionClient(credential)
-
-    # Fetch data from Azure
-    subscriptions = list(subscription_client.subscriptions.list())
-    data = {
-        "subscriptions": [(sub.subscription_id, sub.display_name) for sub in subscriptions],
-        "vnets": [],
-        "subnets": [],
-        "route_tables": [],
-        "nsgs": [],
-        "peerings": [],
-        "vnet_gateways": [],
-        "express_route_circuits": [],
-        "insights": []
-    }
-
-    for sub in subscriptions:
-        subscription_id = sub.subscription_id
-        network_client = NetworkManagementClient(credential, subscription_id)
-        resource_client = ResourceManagementClient(credential, subscription_id)
-
-        # Fetch VNets, subnets, route tables, NSGs, peerings, VNet gateways, and ExpressRoute circuits
-        vnets = list(network_client.virtual_networks.list_all())
-        for vnet in vnets:
-            vnet_data = vnet.as_dict()
-            vnet_data["subscription_id"] = subscription_id
-            vnet_data["resource_group_name"] = vnet.id.split('/')[4]
-            data["vnets"].append(vnet_data)
-            subnets = list(network_client.subnets.list(resource_group_name=vnet_data["resource_group_name"], virtual_network_name=vnet.name))
-            for subnet in subnets:
-                subnet_data = subnet.as_dict()
-                subnet_data["subscription_id"] = subscription_id
-                subnet_data["resource_group_name"] = vnet_data["resource_group_name"]
-                subnet_data["virtual_network_name"] = vnet.name
-                data["subnets"].append(subnet_data)
-                if subnet.route_table:
-                    try:
-                        route_table_id = subnet.route_table.id.split('/')[-1]
-                        route_table_rg = subnet.route_table.id.split('/')[4]
-                        route_table = network_client.route_tables.get(resource_group_name=route_table_rg, route_table_name=route_table_id)
-                        route_table_data = route_table.as_dict()
-                        route_table_data["subscription_id"] = subscription_id
-                        route_table_data["resource_group_name"] = route_table_rg
-                        data["route_tables"].append(route_table_data)
-                    except Exception as e:
-                        logger.error(f"Error fetching route table {subnet.route_table.id}: {e}")
-                if subnet.network_security_group:
-                    try:
-                        nsg_id = subnet.network_security_group.id.split('/')[-1]
-                        nsg_rg = subnet.network_security_group.id.split('/')[4]
-                        nsg = network_client.network_security_groups.get(resource_group_name=nsg_rg, network_security_group_name=nsg_id)
-                        nsg_data = nsg.as_dict()
-                        nsg_data["subscription_id"] = subscription_id
-                        nsg_data["resource_group_name"] = nsg_rg
-                        data["nsgs"].append(nsg_data)
-                    except Exception as e:
-                        logger.error(f"Error fetching NSG {subnet.network_security_group.id}: {e}")
-            peerings = list(network_client.virtual_network_peerings.list(resource_group_name=vnet_data["resource_group_name"], virtual_network_name=vnet.name))
-            for peering in peerings:
-                peering_data = peering.as_dict()
-                peering_data["subscription_id"] = subscription_id
-                peering_data["resource_group_name"] = vnet_data["resource_group_name"]
-                peering_data["virtual_network_name"] = vnet.name
-                data["peerings"].append(peering_data)
-
-            # Fetch VNet gateways
-            vnet_gateways = list(network_client.virtual_network_gateways.list(resource_group_name=vnet_data["resource_group_name"]))
-            for gateway in vnet_gateways:
-                gateway_data = gateway.as_dict()
-                gateway_data["subscription_id"] = subscription_id
-                gateway_data["resource_group_name"] = vnet_data["resource_group_name"]
-                data["vnet_gateways"].append(gateway_data)
-
-        # Fetch ExpressRoute circuits
-        resource_groups = list(resource_client.resource_groups.list())
-        for rg in resource_groups:
-            express_route_circuits = list(network_client.express_route_circuits.list(resource_group_name=rg.name))
-            for circuit in express_route_circuits:
-                circuit_data = circuit.as_dict()
-                circuit_data["subscription_id"] = subscription_id
-                circuit_data["resource_group_name"] = rg.name
-                data["express_route_circuits"].append(circuit_data)
-
-    # Save data to JSON file
-    os.makedirs('environments', exist_ok=True)
-    with open('environments/environment_data.json', 'w') as f:
-        json.dump(data, f, indent=4)  # Pretty-print the JSON data
+    # Fetch data from Azure and save it to the JSON file
+    data = collect_environment()
+    save_environment(data, ENVIRONMENT_FILE)
 
     # Reload the environment data
     load_environment_data()
@@ -359,15 +293,26 @@ def load_environment():
     message = "Environment data loaded successfully!"
     return render_template('index.html', message=message)
 
-@app.route('/routes', methods=['GET', 'POST'])
+@bp.route('/routes', methods=['GET', 'POST'])
 def routes():
-    data = environment_data
+    from tabulate import tabulate
+
+    data = get_environment_data()
     subscriptions = data.get("subscriptions", [])
     results = []
     selected_subscription_id = None
 
     if request.method == 'POST':
         selected_subscription_id = request.form.get('subscription')
+        # Index route tables and NSGs once; id_key compares ID handles instead of rebuilding ID strings
+        route_tables_by_id = {}
+        for rt in data.get("route_tables", []):
+            if rt["subscription_id"] == selected_subscription_id:
+                route_tables_by_id.setdefault(id_key(rt), rt)
+        nsgs_by_id = {}
+        for nsg in data.get("nsgs", []):
+            if nsg["subscription_id"] == selected_subscription_id:
+                nsgs_by_id.setdefault(id_key(nsg), nsg)
         # Process the selected subscription
         for vnet in data.get("vnets", []):
             if vnet["subscription_id"] == selected_subscription_id:
@@ -383,8 +328,8 @@ def routes():
                         route_table_content = "No routes"
                         bgp_propagation = "Unknown"
                         if subnet.get("route_table"):
-                            try:
-                                route_table = next(rt for rt in data.get("route_tables", []) if rt["id"] == subnet["route_table"]["id"] and rt["subscription_id"] == selected_subscription_id)
+                            route_table = route_tables_by_id.get(id_key(subnet, "route_table"))
+                            if route_table is not None:
                                 route_table_name = route_table["name"]
                                 bgp_propagation = "Disabled" if route_table["disable_bgp_route_propagation"] else "Enabled"
                                 if route_table.get("routes"):
@@ -395,22 +340,22 @@ def routes():
                                         tablefmt="plain"
                                     )
                                     route_table_content = nested_table
-                            except StopIteration:
+                            else:
                                 logger.error(f"Route table {subnet['route_table']['id']} not found for subscription {selected_subscription_id}")
                         nsg_name = "None"
                         if subnet.get("network_security_group"):
-                            try:
-                                nsg = next(nsg for nsg in data.get("nsgs", []) if nsg["id"] == subnet["network_security_group"]["id"] and nsg["subscription_id"] == selected_subscription_id)
+                            nsg = nsgs_by_id.get(id_key(subnet, "network_security_group"))
+                            if nsg is not None:
                                 nsg_name = nsg["name"]
-                            except StopIteration:
+                            else:
                                 logger.error(f"NSG {subnet['network_security_group']['id']} not found for subscription {selected_subscription_id}")
                         results.append([f"{vnet_name}<br><strong>{vnet_prefixes}</strong>", f"{subnet_name}<br><strong>{subnet_prefix}</strong>", route_table_name, bgp_propagation, route_table_content, nsg_name])
 
     return render_template('routes.html', results=results, subscriptions=subscriptions, selected_subscription_id=selected_subscription_id)
 
-@app.route('/validate-hub-peerings', methods=['GET', 'POST'])
+@bp.route('/validate-hub-peerings', methods=['GET', 'POST'])
 def validate_hub_peerings():
-    data = environment_data
+    data = get_environment_data()
     results = []
     is_hub = False
     is_spoke = False
@@ -460,12 +405,12 @@ def validate_hub_peerings():
 
     return render_template('validate_hub_peerings.html', results=results, is_hub=is_hub, is_spoke=is_spoke, subscriptions=subscriptions, vnets=vnets, selected_subscription=selected_subscription, selected_vnet=selected_vnet)
 
-@app.route('/auto-validate', methods=['GET', 'POST'])
+@bp.route('/auto-validate', methods=['GET', 'POST'])
 def auto_validate():
     issues = None
     gpt_explanation = ""
     gpt_explanation_raw = ""
-    data = environment_data
+    data = get_environment_data()
     subscriptions = data.get('subscriptions', [])
     selected_subscription_id = None
 
@@ -479,7 +424,7 @@ def auto_validate():
         nsgs = [n for n in data.get('nsgs', []) if n.get('subscription_id') == selected_subscription_id]
         # If you have a firewall IP to check, set it here; otherwise, use None or a default value
         firewall_ip = None
-        issues = validate_routes(subnets, route_tables, nsgs, firewall_ip)
+        issues = validate_routes(subnets, route_tables, nsgs, firewall_ip, data.get('vnets', []), data.get('peerings', []))
 
         # Prepare filtered data for LLM
         filtered_data = {
@@ -516,6 +461,7 @@ def auto_validate():
                         need_cont = True
             if need_cont:
                 try:
+                    import openai
                     cont_prompt = "The previous response you generated may have been truncated. Continue the markdown report from where it likely left off; do not repeat earlier content. Keep the same style."
                     cont_resp = openai.chat.completions.create(
                         model=preferred_model,
@@ -590,76 +536,10 @@ def auto_validate():
 
     return render_template('auto_validate.html', issues=issues, gpt_explanation=gpt_explanation, gpt_explanation_raw=gpt_explanation_raw, subscriptions=subscriptions, selected_subscription_id=selected_subscription_id)
 
-def validate_routes(subnets, route_tables, nsgs, firewall_ip):
-    issues = []
-
-    for route_table in route_tables:
-        for route in route_table["routes"]:
-            if route["next_hop_type"] == 'VirtualAppliance' and route.get("next_hop_ip_address") != firewall_ip:
-                issues.append({
-                    "subscription": route_table["subscription_id"],
-                    "route_table_name": route_table["name"],
-                    "route_name": route["name"],
-                    "description": f"has an incorrect next hop IP address: {route.get('next_hop_ip_address')}"
-                })
-
-    # Add more validation checks as needed
-
-    return issues
-
-
-def compute_insights(data):
-    """Return a list of insight dicts per subscription for the /insights page."""
-    insights = []
-    subscriptions = data.get('subscriptions', [])
-    for sub in subscriptions:
-        try:
-            sub_id = sub[0]
-            sub_name = sub[1] if len(sub) > 1 else sub_id
-        except Exception:
-            # If the subscriptions were stored as dicts or strings, fall back
-            if isinstance(sub, dict):
-                sub_id = sub.get('subscription_id') or sub.get('id') or str(sub)
-                sub_name = sub.get('display_name') or sub.get('name') or sub_id
-            else:
-                sub_id = str(sub)
-                sub_name = str(sub)
-
-        total_vnets = len([v for v in data.get('vnets', []) if v.get('subscription_id') == sub_id])
-        total_subnets = len([s for s in data.get('subnets', []) if s.get('subscription_id') == sub_id])
-        total_nsgs = len([n for n in data.get('nsgs', []) if n.get('subscription_id') == sub_id])
-        total_route_tables = len([rt for rt in data.get('route_tables', []) if rt.get('subscription_id') == sub_id])
-        # Estimate subnets with BGP enabled by counting route tables that do not disable BGP propagation
-        subnets_with_bgp = 0
-        for rt in data.get('route_tables', []):
-            if rt.get('subscription_id') == sub_id and not rt.get('disable_bgp_route_propagation'):
-                subnets_with_bgp += 1
-
-        total_peerings = len([p for p in data.get('peerings', []) if p.get('subscription_id') == sub_id])
-        total_vnet_gateways = len([g for g in data.get('vnet_gateways', []) if g.get('subscription_id') == sub_id])
-        total_express = len([e for e in data.get('express_route_circuits', []) if e.get('subscription_id') == sub_id])
-        regions = sorted(list({v.get('location') for v in data.get('vnets', []) if v.get('subscription_id') == sub_id and v.get('location')}))
-
-        insights.append({
-            "Subscription Name": sub_name,
-            "Total VNets": total_vnets,
-            "Total Subnets": total_subnets,
-            "Total NSGs": total_nsgs,
-            "Total Route Tables": total_route_tables,
-            "Subnets with BGP Enabled": subnets_with_bgp,
-            "Total Peerings": total_peerings,
-            "Total VNet Gateways": total_vnet_gateways,
-            "Total ExpressRoute Circuits": total_express,
-            "Regions": ", ".join(regions) if regions else "N/A"
-        })
-
-    return insights
-
-
-@app.route('/insights', methods=['GET'])
+@bp.route('/insights', methods=['GET'])
 def insights():
     """Render the insights page. If environment data is empty, the template shows a friendly empty state."""
-    data = environment_data
+    data = get_environment_data()
     insights_list = []
     try:
         insights_list = compute_insights(data)
@@ -668,9 +548,109 @@ def insights():
         insights_list = []
     return render_template('insights.html', insights=insights_list)
 
-@app.route('/pretty-json')
+@bp.route('/trace', methods=['GET', 'POST'])
+def trace():
+    """Trace a flow between two IPs hop by hop through the loaded environment."""
+    result = None
+    source = destination = source_vnet = None
+    protocol = 'TCP'
+    port = 443
+    if request.method == 'POST':
+        source = (request.form.get('source') or '').strip()
+        destination = (request.form.get('destination') or '').strip()
+        protocol = (request.form.get('protocol') or 'TCP').strip().upper()
+        port = (request.form.get('port') or '443').strip()
+        source_vnet = (request.form.get('source_vnet') or '').strip() or None
+        result = get_trace_index(get_environment_data()).trace(source, destination, protocol, port, source_vnet)
+    return render_template('trace.html', result=result, source=source, destination=destination, protocol=protocol, port=port, source_vnet=source_vnet)
+
+@bp.route('/api/trace', methods=['GET', 'POST'])
+def api_trace():
+    """
+    GET  /api/trace?source=10.0.0.4&destination=10.1.0.4[&protocol=TCP&port=443&source_vnet=NAME] -> one trace
+    POST /api/trace with {"pairs": [[src, dst], [src, dst, protocol, port, source_vnet], ...], "protocol": "TCP", "port": 443, "source_vnet": NAME} -> list of traces
+    A pair may stop after any field past dst; the body's protocol, port and source_vnet fill in the rest.
+    source_vnet picks the source subnet when VNet address spaces overlap.
+    """
+    index = get_trace_index(get_environment_data())
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        pairs = body.get('pairs')
+        if not isinstance(pairs, list):
+            return jsonify({"error": "Expected a JSON body with a 'pairs' list"}), 400
+        return jsonify(index.trace_many(pairs, body.get('protocol', 'TCP'), body.get('port', 443), body.get('source_vnet')))
+    source = request.args.get('source')
+    destination = request.args.get('destination')
+    if not source or not destination:
+        return jsonify({"error": "source and destination are required"}), 400
+    return jsonify(index.trace(source, destination, request.args.get('protocol', 'TCP'), request.args.get('port', 443), request.args.get('source_vnet')))
+
+def _search_prefixes(query):
+    """Run a prefix index search; returns (results, elapsed_ms), results is None for an unparseable query."""
+    index = get_prefix_index(get_environment_data())
+    started = time.perf_counter()
+    results = index.search(query)
+    return results, (time.perf_counter() - started) * 1000
+
+@bp.route('/search', methods=['GET'])
+def search():
+    """Find the VNets, subnets, routes, appliances and gateways covering an IP or overlapping a range."""
+    query = (request.args.get('q') or '').strip()
+    results, elapsed_ms, error = None, 0.0, None
+    if query:
+        results, elapsed_ms = _search_prefixes(query)
+        if results is None:
+            error = f"'{query}' is not an IP address, CIDR prefix or IP range"
+    return render_template('search.html', query=query, results=results, elapsed_ms=elapsed_ms, error=error)
+
+@bp.route('/api/search', methods=['GET'])
+def api_search():
+    query = (request.args.get('q') or '').strip()
+    results, elapsed_ms = _search_prefixes(query)
+    if results is None:
+        return jsonify({"error": "q must be an IP address, CIDR prefix or IP range"}), 400
+    return jsonify({"query": query, "elapsed_ms": elapsed_ms, "results": results})
+
+def _run_what_if(edits, firewall_ip=None, pairs=None, protocol='TCP', port=443):
+    """Apply edits to a fresh WhatIf session over the shared snapshot and return its delta. Raises ValueError for bad edits."""
+    if not isinstance(edits, list):
+        raise ValueError("edits must be a list")
+    session = WhatIf(get_environment_data()).apply_all(edits)
+    return session.delta(firewall_ip or None, pairs, protocol, port)
+
+@bp.route('/what-if', methods=['GET', 'POST'])
+def what_if():
+    """Simulate route, route table and peering edits against the loaded environment."""
+    delta, error = None, None
+    edits_text = firewall_ip = pairs_text = ''
+    if request.method == 'POST':
+        edits_text = request.form.get('edits') or ''
+        firewall_ip = (request.form.get('firewall_ip') or '').strip()
+        pairs_text = request.form.get('pairs') or ''
+        pairs = [line.split() for line in pairs_text.splitlines() if len(line.split()) >= 2]
+        try:
+            delta = _run_what_if(json.loads(edits_text or '[]'), firewall_ip, pairs)
+        except json.JSONDecodeError as e:
+            error = f"Edits are not valid JSON: {e}"
+        except ValueError as e:
+            error = str(e)
+    return render_template('what_if.html', delta=delta, error=error, edits=edits_text, firewall_ip=firewall_ip, pairs=pairs_text)
+
+@bp.route('/api/what-if', methods=['POST'])
+def api_what_if():
+    """
+    POST /api/what-if with {"edits": [...], "firewall_ip": "10.0.0.4", "pairs": [[src, dst], ...], "protocol": "TCP", "port": 443}
+    -> validation, effective route and trace deltas against the loaded environment
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        return jsonify(_run_what_if(body.get('edits'), body.get('firewall_ip'), body.get('pairs'), body.get('protocol', 'TCP'), body.get('port', 443)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.route('/pretty-json')
 def pretty_json():
-    file_path = 'environments/environment_data.json'
+    file_path = ENVIRONMENT_FILE
     if os.path.exists(file_path):
         with open(file_path, 'r') as f:
             try:
@@ -682,40 +662,66 @@ def pretty_json():
     else:
         return "Error: JSON file not found"
 
-@app.route('/download-json')
+@bp.route('/download-json')
 def download_json():
-    file_path = 'environments/environment_data.json'
+    file_path = ENVIRONMENT_FILE
     if os.path.exists(file_path):
         return send_file(file_path, as_attachment=True, download_name='environment_data.json')
     else:
         return "Error: JSON file not found"
     
-@app.route('/generate-report', methods=['GET'])
+@bp.route('/generate-report', methods=['GET'])
 def generate_report():
-    data = environment_data
+    data = get_environment_data()
     return render_template('report.html', data=data)
 
-@app.route('/download-report', methods=['GET'])
-def download_report():
-    data = environment_data
-    rendered = render_template('report.html', data=data)
-    # Configure pdfkit options if needed
-    options = {
-        'page-size': 'A4',
-        'orientation': 'Landscape',
-        'margin-top': '10mm',
-        'margin-bottom': '10mm',
-        'margin-left': '10mm',
-        'margin-right': '10mm',
-        'enable-local-file-access': None,  # Allow local file access for images/CSS
-    }
+# Configure pdfkit options if needed
+PDF_OPTIONS = {
+    'page-size': 'A4',
+    'orientation': 'Landscape',
+    'margin-top': '10mm',
+    'margin-bottom': '10mm',
+    'margin-left': '10mm',
+    'margin-right': '10mm',
+    'enable-local-file-access': None,  # Allow local file access for images/CSS
+}
+
+def render_report_pdf(rendered):
+    """Convert the rendered report HTML to PDF bytes (requires pdfkit and wkhtmltopdf)."""
     # If you see a permissions warning for /run/user/1000/, run this in your shell:
     # sudo chmod 700 /run/user/1000/
-    pdf = pdfkit.from_string(rendered, False, options=options)
+    import pdfkit
+    return pdfkit.from_string(rendered, False, options=PDF_OPTIONS)
+
+@bp.route('/download-report', methods=['GET'])
+def download_report():
+    data = get_environment_data()
+    rendered = render_template('report.html', data=data)
+    pdf = render_report_pdf(rendered)
     response = make_response(pdf)
     response.headers['Content-Type'] = 'application/pdf'
     response.headers['Content-Disposition'] = 'attachment; filename=network_report.pdf'
     return response
 
+def create_app(preload_snapshot=None):
+    """
+    Application factory.
+    The snapshot is not parsed here; it loads on the first request that needs it. When
+    preload_snapshot is true (or ROUTEVALIDATOR_PRELOAD_SNAPSHOT=1) it is parsed in a
+    background thread instead, so the first request does not pay for it either.
+    """
+    app = Flask(__name__)
+    app.secret_key = 'your_secret_key'
+    app.register_blueprint(bp)
+
+    if preload_snapshot is None:
+        preload_snapshot = os.environ.get('ROUTEVALIDATOR_PRELOAD_SNAPSHOT') == '1'
+    if preload_snapshot:
+        threading.Thread(target=get_environment_data, name='snapshot-preload', daemon=True).start()
+
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
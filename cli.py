@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Headless routeValidator: crawl, validate and report without running the web server.
+
+    python3 cli.py crawl [--subscription ID ...] [--workers N]
+    python3 cli.py validate [--crawl] [--firewall-ip IP] [--format json|markdown] [--output FILE]
+    python3 cli.py report [--crawl] [--format html|pdf] [--output FILE]
+
+Every command also takes --environment FILE, --subscription ID (repeatable), --workers N and
+--quiet, given after the command name. Every command reads/writes the same environment file
+as the web app (environments/environment_data.json unless --environment is given).
+
+Exit codes: 0 = success, no findings; 1 = validation findings; 2 = usage or runtime error.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from inventory import collect_environment, save_environment
+from snapshot_model import compact_snapshot
+from validation import compute_insights, validate_routes
+
+EXIT_OK = 0
+EXIT_FINDINGS = 1
+EXIT_ERROR = 2
+
+DEFAULT_ENVIRONMENT = os.path.join('environments', 'environment_data.json')
+
+logger = logging.getLogger('routevalidator.cli')
+
+
+def load_snapshot(file_path):
+    with open(file_path, 'r') as f:
+        return compact_snapshot(json.load(f))
+
+
+def crawl(args):
+    data = collect_environment(subscription_ids=args.subscription or None, workers=args.workers)
+    save_environment(data, args.environment)
+    logger.info("Saved %d subscriptions, %d VNets, %d subnets to %s", len(data["subscriptions"]), len(data["vnets"]), len(data["subnets"]), args.environment)
+    return data
+
+
+def run_validation(data, subscription_ids=None, firewall_ip=None):
+    """Run validate_routes per subscription (as the Auto-Validate page does) plus compute_insights."""
+    results = []
+    for sub in data.get('subscriptions', []):
+        subscription_id, subscription_name = sub[0], sub[1] if len(sub) > 1 else sub[0]
+        if subscription_ids and subscription_id not in subscription_ids:
+            continue
+        subnets = [s for s in data.get('subnets', []) if s.get('subscription_id') == subscription_id]
+        route_tables = [rt for rt in data.get('route_tables', []) if rt.get('subscription_id') == subscription_id]
+        nsgs = [n for n in data.get('nsgs', []) if n.get('subscription_id') == subscription_id]
+        results.append({
+            "subscription_id": subscription_id,
+            "subscription_name": subscription_name,
+            "issues": validate_routes(subnets, route_tables, nsgs, firewall_ip, data.get('vnets', []), data.get('peerings', [])),
+        })
+    return {"subscriptions": results, "insights": compute_insights(data)}
+
+
+def format_markdown(result):
+    from tabulate import tabulate
+
+    lines = ["# routeValidator validation", ""]
+    if result["insights"]:
+        lines += ["## Insights", "", tabulate(result["insights"], headers="keys", tablefmt="github"), ""]
+    for sub in result["subscriptions"]:
+        lines += [f"## {sub['subscription_name']} ({sub['subscription_id']})", ""]
+        if not sub["issues"]:
+            lines += ["No findings.", ""]
+            continue
+        rows = [[issue.get("route_table_name") or issue.get("nsg_name"), issue.get("route_name") or issue.get("rule_name"), issue["description"]] for issue in sub["issues"]]
+        lines += [tabulate(rows, headers=["Resource", "Route / Rule", "Finding"], tablefmt="github"), ""]
+    return "\n".join(lines)
+
+
+def write_output(content, output):
+    if output in (None, '-'):
+        if isinstance(content, bytes):
+            sys.stdout.buffer.write(content)
+        else:
+            sys.stdout.write(content if content.endswith("\n") else content + "\n")
+        return
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'wb' if isinstance(content, bytes) else 'w') as f:
+        f.write(content)
+    logger.info("Wrote %s", output)
+
+
+def validate(args):
+    data = compact_snapshot(crawl(args)) if args.crawl else load_snapshot(args.environment)
+    result = run_validation(data, args.subscription or None, args.firewall_ip)
+    if args.format == 'markdown':
+        write_output(format_markdown(result), args.output)
+    else:
+        write_output(json.dumps(result, indent=4), args.output)
+    findings = sum(len(sub["issues"]) for sub in result["subscriptions"])
+    logger.info("%d finding(s) across %d subscription(s)", findings, len(result["subscriptions"]))
+    return EXIT_FINDINGS if findings and not args.no_fail else EXIT_OK
+
+
+def report(args):
+    # The report template is shared with the web app; render it in a request context, no server needed
+    from flask import render_template
+    from app import app, render_report_pdf
+
+    data = compact_snapshot(crawl(args)) if args.crawl else load_snapshot(args.environment)
+    with app.test_request_context('/generate-report'):
+        rendered = render_template('report.html', data=data)
+    write_output(render_report_pdf(rendered) if args.format == 'pdf' else rendered, args.output or f'network_report.{args.format}')
+    return EXIT_OK
+
+
+def build_parser():
+    # Shared options go on every subcommand, so they are given after it: cli.py validate --quiet
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--environment', default=DEFAULT_ENVIRONMENT, help=f'environment JSON file (default: {DEFAULT_ENVIRONMENT})')
+    common.add_argument('--subscription', action='append', metavar='ID', help='limit to this subscription id (repeatable)')
+    common.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='parallel processes for crawling subscriptions')
+    common.add_argument('--quiet', action='store_true', help='only log warnings and errors')
+
+    parser = argparse.ArgumentParser(prog='cli.py', description='Crawl, validate and report on Azure VNet routing without the web server.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('crawl', parents=[common], help='fetch the environment from Azure and save it')
+
+    validate_parser = commands.add_parser('validate', parents=[common], help='run route and NSG validation; exits 1 on findings')
+    validate_parser.add_argument('--crawl', action='store_true', help='crawl Azure first instead of reading the saved environment')
+    validate_parser.add_argument('--firewall-ip', help='expected next hop IP for VirtualAppliance routes')
+    validate_parser.add_argument('--format', choices=('json', 'markdown'), default='json')
+    validate_parser.add_argument('--output', '-o', help='output file (default: stdout)')
+    validate_parser.add_argument('--no-fail', action='store_true', help='exit 0 even when there are findings')
+
+    report_parser = commands.add_parser('report', parents=[common], help='render the network report')
+    report_parser.add_argument('--crawl', action='store_true', help='crawl Azure first instead of reading the saved environment')
+    report_parser.add_argument('--format', choices=('html', 'pdf'), default='pdf')
+    report_parser.add_argument('--output', '-o', help='output file, - for stdout (default: network_report.<format>)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format='%(levelname)s %(name)s: %(message)s', stream=sys.stderr)
+    try:
+        if args.command == 'crawl':
+            crawl(args)
+            return EXIT_OK
+        if args.command == 'validate':
+            return validate(args)
+        return report(args)
+    except Exception:
+        logger.exception("%s failed", args.command)
+        return EXIT_ERROR
+
+
+if __name__ == '__main__':
+    sys.exit(main())
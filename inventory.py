@@ -0,0 +1,138 @@
+"""
+Azure inventory crawl shared by the /load-environment route and the CLI.
+
+collect_environment() returns the environment_data.json structure. Each subscription is
+crawled independently, so with workers > 1 subscriptions are fetched in parallel processes;
+each process builds its own DefaultAzureCredential (credentials cannot be shared between
+processes). The Azure SDKs are imported on first use.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_KEYS = ("vnets", "subnets", "route_tables", "nsgs", "peerings", "vnet_gateways", "express_route_circuits")
+
+
+def list_subscriptions(credential=None):
+    """Return [(subscription_id, display_name), ...] visible to the credential."""
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.resource import SubscriptionClient
+
+    credential = credential or DefaultAzureCredential()
+    subscription_client = SubscriptionClient(credential)
+    return [(sub.subscription_id, sub.display_name) for sub in subscription_client.subscriptions.list()]
+
+
+def collect_subscription(subscription_id, credential=None):
+    """Fetch VNets, subnets, route tables, NSGs, peerings, VNet gateways and ExpressRoute circuits for one subscription."""
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.network import NetworkManagementClient
+    from azure.mgmt.resource import ResourceManagementClient
+
+    credential = credential or DefaultAzureCredential()
+    data = {key: [] for key in RESOURCE_KEYS}
+    network_client = NetworkManagementClient(credential, subscription_id)
+    resource_client = ResourceManagementClient(credential, subscription_id)
+
+    # Fetch VNets, subnets, route tables, NSGs, peerings, VNet gateways, and ExpressRoute circuits
+    vnets = list(network_client.virtual_networks.list_all())
+    for vnet in vnets:
+        vnet_data = vnet.as_dict()
+        vnet_data["subscription_id"] = subscription_id
+        vnet_data["resource_group_name"] = vnet.id.split('/')[4]
+        data["vnets"].append(vnet_data)
+        subnets = list(network_client.subnets.list(resource_group_name=vnet_data["resource_group_name"], virtual_network_name=vnet.name))
+        for subnet in subnets:
+            subnet_data = subnet.as_dict()
+            subnet_data["subscription_id"] = subscription_id
+            subnet_data["resource_group_name"] = vnet_data["resource_group_name"]
+            subnet_data["virtual_network_name"] = vnet.name
+            data["subnets"].append(subnet_data)
+            if subnet.route_table:
+                try:
+                    route_table_id = subnet.route_table.id.split('/')[-1]
+                    route_table_rg = subnet.route_table.id.split('/')[4]
+                    route_table = network_client.route_tables.get(resource_group_name=route_table_rg, route_table_name=route_table_id)
+                    route_table_data = route_table.as_dict()
+                    route_table_data["subscription_id"] = subscription_id
+                    route_table_data["resource_group_name"] = route_table_rg
+                    data["route_tables"].append(route_table_data)
+                except Exception as e:
+                    logger.error(f"Error fetching route table {subnet.route_table.id}: {e}")
+            if subnet.network_security_group:
+                try:
+                    nsg_id = subnet.network_security_group.id.split('/')[-1]
+                    nsg_rg = subnet.network_security_group.id.split('/')[4]
+                    nsg = network_client.network_security_groups.get(resource_group_name=nsg_rg, network_security_group_name=nsg_id)
+                    nsg_data = nsg.as_dict()
+                    nsg_data["subscription_id"] = subscription_id
+                    nsg_data["resource_group_name"] = nsg_rg
+                    data["nsgs"].append(nsg_data)
+                except Exception as e:
+                    logger.error(f"Error fetching NSG {subnet.network_security_group.id}: {e}")
+        peerings = list(network_client.virtual_network_peerings.list(resource_group_name=vnet_data["resource_group_name"], virtual_network_name=vnet.name))
+        for peering in peerings:
+            peering_data = peering.as_dict()
+            peering_data["subscription_id"] = subscription_id
+            peering_data["resource_group_name"] = vnet_data["resource_group_name"]
+            peering_data["virtual_network_name"] = vnet.name
+            data["peerings"].append(peering_data)
+
+        # Fetch VNet gateways
+        vnet_gateways = list(network_client.virtual_network_gateways.list(resource_group_name=vnet_data["resource_group_name"]))
+        for gateway in vnet_gateways:
+            gateway_data = gateway.as_dict()
+            gateway_data["subscription_id"] = subscription_id
+            gateway_data["resource_group_name"] = vnet_data["resource_group_name"]
+            data["vnet_gateways"].append(gateway_data)
+
+    # Fetch ExpressRoute circuits
+    resource_groups = list(resource_client.resource_groups.list())
+    for rg in resource_groups:
+        express_route_circuits = list(network_client.express_route_circuits.list(resource_group_name=rg.name))
+        for circuit in express_route_circuits:
+            circuit_data = circuit.as_dict()
+            circuit_data["subscription_id"] = subscription_id
+            circuit_data["resource_group_name"] = rg.name
+            data["express_route_circuits"].append(circuit_data)
+
+    return data
+
+
+def collect_environment(subscription_ids=None, workers=1):
+    """
+    Crawl all visible subscriptions (or only subscription_ids) and return the environment data.
+    With workers > 1, subscriptions are crawled in parallel processes; results keep subscription order.
+    """
+    from azure.identity import DefaultAzureCredential
+
+    credential = DefaultAzureCredential()
+    subscriptions = list_subscriptions(credential)
+    if subscription_ids:
+        subscriptions = [sub for sub in subscriptions if sub[0] in subscription_ids]
+
+    data = {"subscriptions": subscriptions}
+    data.update({key: [] for key in RESOURCE_KEYS})
+    data["insights"] = []
+
+    ids = [sub[0] for sub in subscriptions]
+    if workers > 1 and len(ids) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ids))) as pool:
+            results = list(pool.map(collect_subscription, ids))
+    else:
+        results = [collect_subscription(subscription_id, credential) for subscription_id in ids]
+
+    for result in results:
+        for key in RESOURCE_KEYS:
+            data[key].extend(result[key])
+    return data
+
+
+def save_environment(data, file_path):
+    """Write environment data as pretty-printed JSON (the environments/environment_data.json format)."""
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with open(file_path, 'w') as f:
+        json.dump(data, f, indent=4)  # Pretty-print the JSON data
@@ -0,0 +1,411 @@
+"""
+NSG rule compiler.
+
+Each NSG's security_rules and default_security_rules are compiled, per direction, into one
+interval table per match dimension (protocol, source/destination address, source/destination
+port). Every elementary interval carries a bitmask of the rules covering it, with bit 0 being
+the highest-priority rule. A lookup bisects each table (O(log n)), ANDs the masks and takes
+the lowest set bit, which is the rule Azure would apply.
+
+Addresses live in one 128-bit space: IPv4 is mapped into ::ffff:0:0/96 so IPv4 and IPv6
+prefixes share a table. Service tags (VirtualNetwork, Internet, AzureLoadBalancer, ...) are
+matched by name; pass service_tags={'VirtualNetwork': [...prefixes]} to also match them by IP
+(vnet_service_tags() resolves the tags a VNet's NSGs see). A tag with no known prefixes, or one
+named in incomplete_tags, may still contain any IP: decide() reports when such a tag could
+change the verdict.
+
+Compiled NSGs are memoized per (id, etag), so an NSG is only recompiled after it changes.
+"""
+import ipaddress
+import threading
+from bisect import bisect_right
+
+ADDRESS_MAX = (1 << 128) - 1
+PORT_MAX = 65535
+IPV4_MAPPED = 0xFFFF << 32
+ANY = ('*', 'any', '0.0.0.0/0', '::/0')
+PROTOCOLS = ('TCP', 'UDP', 'ICMP', 'ESP', 'AH')
+AZURE_LOAD_BALANCER = '168.63.129.16/32'
+# Ranges never reached over the Internet, left out of the Internet tag along with the VNet's own
+NON_INTERNET = (
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12',
+    '192.0.0.0/24', '192.168.0.0/16', '198.18.0.0/15', '224.0.0.0/3',
+    '::/127', '::ffff:0:0/96', 'fc00::/7', 'fe80::/10', 'ff00::/8',
+)
+
+
+def address_interval(value):
+    """Return the (first, last) interval of an IP or CIDR in the shared 128-bit space, or None for a service tag."""
+    try:
+        network = ipaddress.ip_network(str(value).strip(), strict=False)
+    except ValueError:
+        return None
+    first, last = int(network.network_address), int(network.broadcast_address)
+    if network.version == 4:
+        first, last = first + IPV4_MAPPED, last + IPV4_MAPPED
+    return first, last
+
+
+def port_interval(value):
+    """Parse '*', '443' or '1000-2000' into a (first, last) port interval."""
+    value = str(value).strip()
+    if value in ('*', ''):
+        return 0, PORT_MAX
+    if '-' in value:
+        first, last = value.split('-', 1)
+        return int(first), int(last)
+    return int(value), int(value)
+
+
+def _merge(intervals):
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _rule_values(rule, single, plural):
+    values = list(rule.get(plural) or [])
+    if rule.get(single) not in (None, ''):
+        values.append(rule[single])
+    return values or ['*']
+
+
+class IntervalTable:
+    """Elementary-interval table over [0, upper] mapping each interval to a bitmask of rules."""
+
+    def __init__(self, entries, upper):
+        # entries: (first, last, bit) triples
+        bounds = {0}
+        for first, last, _ in entries:
+            bounds.add(first)
+            if last < upper:
+                bounds.add(last + 1)
+        self.starts = sorted(bounds)
+        self.masks = [0] * len(self.starts)
+        for first, last, bit in entries:
+            index = bisect_right(self.starts, first) - 1
+            while index < len(self.starts) and self.starts[index] <= last:
+                self.masks[index] |= bit
+                index += 1
+
+    def lookup(self, point):
+        return self.masks[bisect_right(self.starts, point) - 1]
+
+
+class CompiledNsg:
+    """Priority-ordered interval tables for one NSG, plus its shadowed/redundant rule findings."""
+
+    def __init__(self, nsg, service_tags=None, incomplete_tags=()):
+        self.id = nsg.get('id')
+        self.name = nsg.get('name')
+        self.etag = nsg.get('etag')
+        self.service_tags = {}
+        for tag, prefixes in (service_tags or {}).items():
+            self.service_tags[tag.lower()] = [i for i in (address_interval(p) for p in prefixes) if i]
+        self.incomplete_tags = {tag.lower() for tag in incomplete_tags}
+
+        custom = sorted(nsg.get('security_rules') or [], key=lambda r: r.get('priority', 0))
+        default = sorted(nsg.get('default_security_rules') or [], key=lambda r: r.get('priority', 0))
+        self.rules = {'inbound': [], 'outbound': []}
+        for rule in custom + default:
+            direction = (rule.get('direction') or '').lower()
+            if direction in self.rules:
+                self.rules[direction].append(self._normalize(rule))
+
+        self.tables = {direction: self._build(rules) for direction, rules in self.rules.items()}
+        self.anomalies = self._find_anomalies()
+
+    def _resolve(self, values):
+        """Split address values into IP intervals and service tag names."""
+        intervals, tags = [], set()
+        for value in values:
+            if str(value).strip().lower() in ANY:
+                return [(0, ADDRESS_MAX)], {'*'}
+            interval = address_interval(value)
+            if interval:
+                intervals.append(interval)
+            else:
+                tag = str(value).strip().lower()
+                tags.add(tag)
+                intervals.extend(self.service_tags.get(tag, []))
+        return _merge(intervals), tags
+
+    def _unresolved(self, tags):
+        """Tags with no known prefixes, or only some of them; they may stand for any address."""
+        return {tag for tag in tags if tag != '*' and (tag not in self.service_tags or tag in self.incomplete_tags)}
+
+    def _normalize(self, rule):
+        protocol = (rule.get('protocol') or '*').upper()
+        source, source_tags = self._resolve(_rule_values(rule, 'source_address_prefix', 'source_address_prefixes'))
+        destination, destination_tags = self._resolve(_rule_values(rule, 'destination_address_prefix', 'destination_address_prefixes'))
+        return {
+            'name': rule.get('name'),
+            'priority': rule.get('priority'),
+            'access': rule.get('access'),
+            'protocols': set(PROTOCOLS) if protocol == '*' else {protocol},
+            'source': source,
+            'source_tags': source_tags,
+            'destination': destination,
+            'destination_tags': destination_tags,
+            'source_unresolved': self._unresolved(source_tags),
+            'destination_unresolved': self._unresolved(destination_tags),
+            'source_ports': _merge(port_interval(p) for p in _rule_values(rule, 'source_port_range', 'source_port_ranges')),
+            'destination_ports': _merge(port_interval(p) for p in _rule_values(rule, 'destination_port_range', 'destination_port_ranges')),
+        }
+
+    @staticmethod
+    def _build(rules):
+        protocols, source_tags, destination_tags = {}, {}, {}
+        source, destination, source_ports, destination_ports = [], [], [], []
+        source_unresolved = destination_unresolved = 0
+        for position, rule in enumerate(rules):
+            bit = 1 << position
+            if rule['source_unresolved']:
+                source_unresolved |= bit
+            if rule['destination_unresolved']:
+                destination_unresolved |= bit
+            for protocol in rule['protocols']:
+                protocols[protocol] = protocols.get(protocol, 0) | bit
+            for tag in rule['source_tags']:
+                source_tags[tag] = source_tags.get(tag, 0) | bit
+            for tag in rule['destination_tags']:
+                destination_tags[tag] = destination_tags.get(tag, 0) | bit
+            source.extend((first, last, bit) for first, last in rule['source'])
+            destination.extend((first, last, bit) for first, last in rule['destination'])
+            source_ports.extend((first, last, bit) for first, last in rule['source_ports'])
+            destination_ports.extend((first, last, bit) for first, last in rule['destination_ports'])
+        return {
+            'protocol': protocols,
+            'source': IntervalTable(source, ADDRESS_MAX),
+            'source_tags': source_tags,
+            'source_unresolved': source_unresolved,
+            'destination': IntervalTable(destination, ADDRESS_MAX),
+            'destination_tags': destination_tags,
+            'destination_unresolved': destination_unresolved,
+            'source_port': IntervalTable(source_ports, PORT_MAX),
+            'destination_port': IntervalTable(destination_ports, PORT_MAX),
+        }
+
+    @staticmethod
+    def _address_masks(table, tags, unresolved, value):
+        """Rules matching value for sure, and rules that match it only if an unresolved tag contains it."""
+        interval = address_interval(value)
+        if interval:
+            return table.lookup(interval[0]), unresolved
+        tag = str(value).strip().lower()
+        # '*' rules match any tag, so they are part of every tag lookup
+        return tags.get(tag, 0) | tags.get('*', 0), 0
+
+    def evaluate(self, direction, protocol, source, destination, destination_port, source_port=None):
+        """
+        Return the rule that decides the flow (a normalized rule dict with name, priority and access),
+        or None if no rule matches. source/destination may be an IP or a service tag name.
+        """
+        return self.decide(direction, protocol, source, destination, destination_port, source_port)[0]
+
+    def decide(self, direction, protocol, source, destination, destination_port, source_port=None):
+        """
+        Return (rule, unresolved_rule): the rule evaluate() returns, and the first higher-priority rule
+        with the other access that would decide the flow instead if one of its unresolved tags contains
+        source or destination. unresolved_rule is None when the verdict does not depend on such a tag.
+        """
+        direction = direction.lower()
+        rules = self.rules.get(direction)
+        if not rules:
+            return None, None
+        table = self.tables[direction]
+        protocol = (protocol or '*').upper()
+        if protocol == '*':
+            mask = 0
+            for bits in table['protocol'].values():
+                mask |= bits
+        else:
+            mask = table['protocol'].get(protocol, 0)
+        if mask:
+            mask &= table['destination_port'].lookup(int(destination_port))
+        if mask and source_port is not None:
+            mask &= table['source_port'].lookup(int(source_port))
+        if not mask:
+            return None, None
+        source_mask, source_maybe = self._address_masks(table['source'], table['source_tags'], table['source_unresolved'], source)
+        destination_mask, destination_maybe = self._address_masks(
+            table['destination'], table['destination_tags'], table['destination_unresolved'], destination)
+        matched = mask & source_mask & destination_mask
+        possible = mask & (source_mask | source_maybe) & (destination_mask | destination_maybe)
+
+        rule = rules[(matched & -matched).bit_length() - 1] if matched else None
+        if matched:
+            possible &= (matched & -matched) - 1
+        access = rule['access'] if rule else 'Deny'
+        while possible:
+            bit = possible & -possible
+            other = rules[bit.bit_length() - 1]
+            if other['access'] != access:
+                return rule, other
+            possible ^= bit
+        return rule, None
+
+    def is_allowed(self, direction, protocol, source, destination, destination_port, source_port=None):
+        """True if the deciding rule allows the flow. Azure denies flows no rule matches."""
+        rule = self.evaluate(direction, protocol, source, destination, destination_port, source_port)
+        return bool(rule) and rule['access'] == 'Allow'
+
+    def _find_anomalies(self):
+        """
+        Pairwise rule anomalies, per direction:
+        - shadowed: a higher-priority rule with the opposite access covers every flow of the rule, so it never applies.
+        - redundant: a higher-priority rule with the same access covers it, or a lower-priority rule with the same
+          access covers it and no rule in between overlaps it with the opposite access.
+        """
+        anomalies = []
+        for direction, rules in self.rules.items():
+            for index, rule in enumerate(rules):
+                finding = None
+                for earlier in rules[:index]:
+                    if _covers(earlier, rule):
+                        kind = 'redundant' if earlier['access'] == rule['access'] else 'shadowed'
+                        finding = (kind, earlier)
+                        break
+                if finding is None:
+                    for later_index in range(index + 1, len(rules)):
+                        later = rules[later_index]
+                        if later['access'] != rule['access'] and _overlaps(later, rule):
+                            break
+                        # Equal rules are reported once, on the lower-priority copy
+                        if later['access'] == rule['access'] and _covers(later, rule) and not _covers(rule, later):
+                            finding = ('redundant', later)
+                            break
+                if finding:
+                    kind, other = finding
+                    anomalies.append({
+                        'nsg_name': self.name,
+                        'direction': direction,
+                        'kind': kind,
+                        'rule_name': rule['name'],
+                        'priority': rule['priority'],
+                        'covered_by': other['name'],
+                        'covered_by_priority': other['priority'],
+                    })
+        return anomalies
+
+
+def _contains(outer, inner):
+    """True if every interval in inner lies inside the merged intervals of outer."""
+    for first, last in inner:
+        index = bisect_right(outer, (first, ADDRESS_MAX)) - 1
+        if index < 0 or outer[index][1] < last:
+            return False
+    return True
+
+
+def _intersects(left, right):
+    return any(a <= d and c <= b for a, b in left for c, d in right)
+
+
+def _tags_covered(outer_tags, inner_tags):
+    # Tags are opaque unless resolved, so a tag is only covered by the same tag or by '*'.
+    return '*' in outer_tags or inner_tags <= outer_tags
+
+
+def _covers(outer, inner):
+    return (
+        inner['protocols'] <= outer['protocols']
+        and _tags_covered(outer['source_tags'], inner['source_tags'])
+        and _tags_covered(outer['destination_tags'], inner['destination_tags'])
+        and _contains(outer['source'], inner['source'])
+        and _contains(outer['destination'], inner['destination'])
+        and _contains(outer['source_ports'], inner['source_ports'])
+        and _contains(outer['destination_ports'], inner['destination_ports'])
+    )
+
+
+def _overlaps(left, right):
+    def addresses(side):
+        # An unresolved tag (Internet, AzureLoadBalancer, ...) may contain any IP or tag on the other side
+        return (
+            _intersects(left[side], right[side])
+            or bool(left[side + '_tags'] & right[side + '_tags'])
+            or '*' in left[side + '_tags'] or '*' in right[side + '_tags']
+            or bool(left[side + '_unresolved'] and (right[side] or right[side + '_tags']))
+            or bool(right[side + '_unresolved'] and (left[side] or left[side + '_tags']))
+        )
+    return (
+        bool(left['protocols'] & right['protocols'])
+        and addresses('source')
+        and addresses('destination')
+        and _intersects(left['source_ports'], right['source_ports'])
+        and _intersects(left['destination_ports'], right['destination_ports'])
+    )
+
+
+_compiled_cache = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_nsg(nsg, service_tags=None, incomplete_tags=()):
+    """Compile an NSG dict (as stored in environment_data['nsgs']), memoized per NSG id and etag."""
+    tags_key = tuple(sorted((tag, tuple(prefixes)) for tag, prefixes in (service_tags or {}).items()))
+    key = (nsg.get('id'), nsg.get('etag'), tags_key, tuple(sorted(incomplete_tags)))
+    if key[1] is None:
+        return CompiledNsg(nsg, service_tags, incomplete_tags)
+    with _compiled_lock:
+        compiled = _compiled_cache.get(key)
+    if compiled is None:
+        compiled = CompiledNsg(nsg, service_tags, incomplete_tags)
+        with _compiled_lock:
+            # Drop compilations of older etags of the same NSG
+            for stale in [k for k in _compiled_cache if k[0] == key[0] and k[1] != key[1]]:
+                del _compiled_cache[stale]
+            _compiled_cache[key] = compiled
+    return compiled
+
+
+def virtual_network_tag(vnet, peerings):
+    """Prefixes Azure puts in the VirtualNetwork service tag for a VNet: its address space plus peered address spaces."""
+    prefixes = list((vnet.get('address_space') or {}).get('address_prefixes') or [])
+    for peering in peerings:
+        if peering.get('virtual_network_name') != vnet.get('name') or peering.get('resource_group_name') != vnet.get('resource_group_name'):
+            continue
+        if peering.get('peering_state') not in (None, 'Connected'):
+            continue
+        remote = peering.get('remote_address_space') or peering.get('remote_virtual_network_address_space') or {}
+        prefixes.extend(remote.get('address_prefixes') or [])
+    return prefixes
+
+
+def internet_tag(virtual_network_prefixes):
+    """Prefixes of the Internet service tag: every address outside the VNet's VirtualNetwork prefixes and NON_INTERNET."""
+    holes = {4: [], 6: []}
+    for prefix in list(NON_INTERNET) + list(virtual_network_prefixes):
+        try:
+            network = ipaddress.ip_network(str(prefix).strip(), strict=False)
+        except ValueError:
+            continue
+        holes[network.version].append(network)
+    prefixes = []
+    for version, everything in ((4, ipaddress.ip_network('0.0.0.0/0')), (6, ipaddress.ip_network('::/0'))):
+        remaining = [everything]
+        for hole in ipaddress.collapse_addresses(holes[version]):
+            outside = []
+            for network in remaining:
+                if hole.subnet_of(network):
+                    outside.extend(network.address_exclude(hole))
+                elif not network.subnet_of(hole):
+                    outside.append(network)
+            remaining = outside
+        prefixes.extend(str(network) for network in ipaddress.collapse_addresses(remaining))
+    return prefixes
+
+
+def vnet_service_tags(vnet, peerings):
+    """The service tags NSGs in a VNet are resolved with: VirtualNetwork, Internet and AzureLoadBalancer."""
+    virtual_network = virtual_network_tag(vnet, peerings)
+    return {
+        'VirtualNetwork': virtual_network,
+        'Internet': internet_tag(virtual_network),
+        'AzureLoadBalancer': [AZURE_LOAD_BALANCER],
+    }
@@ -0,0 +1,432 @@
+"""
+Hop-by-hop path tracing between two IPs over the environment snapshot.
+
+The trace starts in the subnet that contains the source IP (the caller names the source VNet
+when VNet address spaces overlap), looks the destination up in that subnet's forwarding table
+(system routes for the VNet, its peerings and the Azure defaults, overridden by the UDRs of the
+subnet's route table), and follows the next hop:
+- VnetLocal / VNetPeering: deliver to the destination subnet in the local / peered VNet
+- VirtualAppliance: enter the appliance's subnet and route again from there
+- VirtualNetworkGateway: leave Azure through the VNet's (or the remote hub's) gateway
+- Internet / None: leave Azure or drop
+
+NSGs are evaluated with nsg_rules at every subnet the packet leaves or enters. The VirtualNetwork,
+Internet and AzureLoadBalancer tags are resolved to prefixes; when the verdict hangs on a tag the
+snapshot cannot resolve (another service tag, or the on-premises prefixes a gateway adds to
+VirtualNetwork), the trace ends as Unknown rather than guessing.
+
+Forwarding tables are built once per subnet and cached on the TraceIndex, and get_trace_index()
+keeps one index per snapshot, so batches of traces only pay for lookups.
+"""
+import ipaddress
+import threading
+
+from nsg_rules import PORT_MAX, PROTOCOLS, compile_nsg, vnet_service_tags
+
+MAX_HOPS = 16
+
+# Azure's default system routes besides the VNet's own address space
+DEFAULT_ROUTES = (
+    ('0.0.0.0/0', 'Internet'),
+    ('10.0.0.0/8', 'None'),
+    ('172.16.0.0/12', 'None'),
+    ('192.168.0.0/16', 'None'),
+    ('100.64.0.0/10', 'None'),
+)
+
+
+def _key(resource_id):
+    return (resource_id or '').lower()
+
+
+def subnet_prefixes(subnet):
+    """Subnets carry either address_prefix or address_prefixes depending on how they were created."""
+    prefixes = list(subnet.get('address_prefixes') or [])
+    if subnet.get('address_prefix') and subnet['address_prefix'] not in prefixes:
+        prefixes.append(subnet['address_prefix'])
+    return prefixes
+
+
+class PrefixTable:
+    """
+    Longest-prefix-match table: one dict per prefix length, probed from the longest length down.
+    Each prefix keeps every value added for it; lookup() returns the last one added.
+    """
+
+    def __init__(self):
+        self._tables = {4: {}, 6: {}}
+        self._lengths = {4: [], 6: []}
+
+    def add(self, prefix, value):
+        try:
+            network = ipaddress.ip_network(prefix, strict=False)
+        except ValueError:
+            return
+        bits = network.max_prefixlen
+        table = self._tables[network.version].setdefault(network.prefixlen, {})
+        table.setdefault(int(network.network_address) >> (bits - network.prefixlen), []).append(value)
+        if network.prefixlen not in self._lengths[network.version]:
+            self._lengths[network.version] = sorted(self._lengths[network.version] + [network.prefixlen], reverse=True)
+
+    def lookup(self, address):
+        """Return the value of the longest prefix containing address, or None."""
+        bits = address.max_prefixlen
+        value = int(address)
+        tables = self._tables[address.version]
+        for length in self._lengths[address.version]:
+            entries = tables[length].get(value >> (bits - length))
+            if entries:
+                return entries[-1]
+        return None
+
+    def lookup_all(self, address):
+        """Every value of every prefix containing address, most specific first."""
+        bits = address.max_prefixlen
+        value = int(address)
+        tables = self._tables[address.version]
+        found = []
+        for length in self._lengths[address.version]:
+            found.extend(tables[length].get(value >> (bits - length), ()))
+        return found
+
+    def values(self):
+        """The last value added for each prefix, most specific prefix first."""
+        for version in (4, 6):
+            for length in self._lengths[version]:
+                for key in sorted(self._tables[version][length]):
+                    yield self._tables[version][length][key][-1]
+
+
+class TraceIndex:
+    """Lookup structures for one snapshot: subnets by IP, VNets, route tables, NSGs, gateways and per-subnet forwarding tables."""
+
+    def __init__(self, data):
+        self.data = data
+        self.vnets = {_key(v.get('id')): v for v in data.get('vnets', [])}
+        self.route_tables = {_key(rt.get('id')): rt for rt in data.get('route_tables', [])}
+        self.nsgs = {_key(n.get('id')): n for n in data.get('nsgs', [])}
+
+        # Address spaces of unpeered VNets may overlap, so subnets are indexed globally (to find every
+        # candidate for a source) and per VNet (to deliver within the VNet a route leads to).
+        # The tables hold subnet keys; records are read from self.subnets.
+        self.subnets = {}
+        self.subnet_index = PrefixTable()
+        self.vnet_subnets = {}
+        for subnet in data.get('subnets', []):
+            subnet_id = _key(subnet.get('id'))
+            self.subnets[subnet_id] = subnet
+            vnet_table = self.vnet_subnets.setdefault(subnet_id.split('/subnets/')[0], PrefixTable())
+            for prefix in subnet_prefixes(subnet):
+                self.subnet_index.add(prefix, subnet_id)
+                vnet_table.add(prefix, subnet_id)
+
+        self.peerings = {}
+        self.peerings_by_id = {}
+        for peering in data.get('peerings', []):
+            vnet_id = _key(peering.get('id')).split('/virtualnetworkpeerings/')[0]
+            self.peerings.setdefault(vnet_id, []).append(peering)
+            self.peerings_by_id[_key(peering.get('id'))] = peering
+
+        self.gateways = {}
+        for gateway in data.get('vnet_gateways', []):
+            for config in gateway.get('ip_configurations') or []:
+                vnet_id = _key((config.get('subnet') or {}).get('id')).split('/subnets/')[0]
+                if vnet_id and all(known is not gateway for known in self.gateways.get(vnet_id, [])):
+                    self.gateways.setdefault(vnet_id, []).append(gateway)
+
+        self._forwarding = {}
+        self._tags = {}
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def subnets_at(self, address):
+        """Every subnet containing address; more than one means overlapping VNet address spaces."""
+        return [self.subnets[subnet_id] for subnet_id in dict.fromkeys(self.subnet_index.lookup_all(address))]
+
+    def subnet_in(self, vnet_id, address):
+        """The subnet of the VNet that contains address, or None."""
+        table = self.vnet_subnets.get(vnet_id)
+        subnet_id = table.lookup(address) if table else None
+        return self.subnets.get(subnet_id) if subnet_id else None
+
+    def locate(self, subnet, address):
+        """Subnet an address is reached in from subnet: its own VNet first, then the VNets it is peered with."""
+        vnet_id = _key(subnet.get('id')).split('/subnets/')[0]
+        found = self.subnet_in(vnet_id, address)
+        for peering in self.peerings.get(vnet_id, []):
+            if found is not None:
+                break
+            if peering.get('peering_state') in (None, 'Connected'):
+                found = self.subnet_in(_key((peering.get('remote_virtual_network') or {}).get('id')), address)
+        return found
+
+    def vnet_of(self, subnet):
+        return self.vnets.get(_key(subnet.get('id')).split('/subnets/')[0])
+
+    def service_tags(self, vnet_id):
+        tags = self._tags.get(vnet_id)
+        if tags is None:
+            vnet = self.vnets.get(vnet_id) or {}
+            tags = vnet_service_tags(vnet, self.peerings.get(vnet_id, []))
+            self._tags[vnet_id] = tags
+        return tags
+
+    def forwarding_table(self, subnet):
+        """The subnet's effective routes as a PrefixTable of route dicts, built on first use."""
+        subnet_id = _key(subnet.get('id'))
+        table = self._forwarding.get(subnet_id)
+        if table is not None:
+            return table
+
+        table = PrefixTable()
+        for prefix, next_hop_type in DEFAULT_ROUTES:
+            table.add(prefix, {'source': 'Default', 'address_prefix': prefix, 'next_hop_type': next_hop_type})
+
+        vnet_id = subnet_id.split('/subnets/')[0]
+        vnet = self.vnets.get(vnet_id) or {}
+        for prefix in (vnet.get('address_space') or {}).get('address_prefixes') or []:
+            table.add(prefix, {'source': 'Default', 'address_prefix': prefix, 'next_hop_type': 'VnetLocal'})
+        for peering in self.peerings.get(vnet_id, []):
+            if peering.get('peering_state') not in (None, 'Connected'):
+                continue
+            remote = peering.get('remote_address_space') or peering.get('remote_virtual_network_address_space') or {}
+            for prefix in remote.get('address_prefixes') or []:
+                table.add(prefix, {'source': 'Default', 'address_prefix': prefix, 'next_hop_type': 'VNetPeering', 'peering': peering})
+
+        route_table = self.route_tables.get(_key((subnet.get('route_table') or {}).get('id')))
+        if route_table:
+            # UDRs win over system routes for the same prefix
+            for route in route_table.get('routes') or []:
+                table.add(route.get('address_prefix'), {
+                    'source': 'User',
+                    'name': route.get('name'),
+                    'route_table_name': route_table.get('name'),
+                    'address_prefix': route.get('address_prefix'),
+                    'next_hop_type': route.get('next_hop_type'),
+                    'next_hop_ip_address': route.get('next_hop_ip_address'),
+                })
+
+        with self._lock:
+            self._forwarding[subnet_id] = table
+        return table
+
+    def effective_routes(self, subnet):
+        """The subnet's forwarding table as a list of plain route dicts, most specific first."""
+        routes = []
+        for route in self.forwarding_table(subnet).values():
+            route = dict(route)
+            peering = route.pop('peering', None)
+            if peering is not None:
+                route['peering_name'] = peering.get('name')
+            routes.append(route)
+        return routes
+
+    def gateway_for(self, vnet_id):
+        """Gateways the VNet sends VirtualNetworkGateway traffic to: its own, or the remote hub's when use_remote_gateways is set."""
+        if self.gateways.get(vnet_id):
+            return self.gateways[vnet_id]
+        for peering in self.peerings.get(vnet_id, []):
+            if peering.get('use_remote_gateways'):
+                remote_id = _key((peering.get('remote_virtual_network') or {}).get('id'))
+                if self.gateways.get(remote_id):
+                    return self.gateways[remote_id]
+        return []
+
+    def compiled_nsg(self, nsg_id, vnet_id):
+        """The NSG compiled with the VNet's service tags, cached per NSG and VNet."""
+        compiled = self._compiled.get((nsg_id, vnet_id))
+        if compiled is None:
+            # The snapshot has no on-premises prefixes, so VirtualNetwork is incomplete behind a gateway
+            incomplete = ('VirtualNetwork',) if self.gateway_for(vnet_id) else ()
+            compiled = compile_nsg(self.nsgs[nsg_id], self.service_tags(vnet_id), incomplete)
+            with self._lock:
+                self._compiled[(nsg_id, vnet_id)] = compiled
+        return compiled
+
+    def check_nsg(self, subnet, direction, protocol, source, destination, port):
+        """
+        Evaluate the subnet's NSG for the flow. Returns (allowed, nsg_name, rule_name, unresolved_rule_name);
+        allowed is None when unresolved_rule_name, a rule with an unresolved service tag, could decide instead.
+        """
+        nsg_id = _key((subnet.get('network_security_group') or {}).get('id'))
+        if nsg_id not in self.nsgs:
+            return True, None, None, None
+        compiled = self.compiled_nsg(nsg_id, _key(subnet.get('id')).split('/subnets/')[0])
+        rule, unresolved = compiled.decide(direction, protocol, source, destination, port)
+        allowed = None if unresolved else bool(rule) and rule['access'] == 'Allow'
+        return allowed, compiled.name, rule['name'] if rule else None, unresolved['name'] if unresolved else None
+
+    def trace(self, source_ip, destination_ip, protocol='TCP', port=443, source_vnet=None):
+        """
+        Trace one flow and return {'source', 'destination', 'status', 'reason', 'hops'}.
+        source_vnet (a VNet name or id) picks the source subnet when VNet address spaces overlap.
+        """
+        result = {'source': source_ip, 'destination': destination_ip, 'protocol': protocol, 'port': port, 'hops': []}
+        try:
+            source = ipaddress.ip_address(str(source_ip).strip())
+            destination = ipaddress.ip_address(str(destination_ip).strip())
+            if not isinstance(protocol, str) or protocol.strip().upper() not in PROTOCOLS + ('*',):
+                raise ValueError(f'{protocol!r} is not a protocol ({", ".join(PROTOCOLS)} or *)')
+            # bool is an int, and int() would accept floats
+            if isinstance(port, bool) or not isinstance(port, (int, str)):
+                raise ValueError(f'{port!r} is not a port number')
+            port = int(port)
+            if not 0 <= port <= PORT_MAX:
+                raise ValueError(f'Port {port} is outside 0-{PORT_MAX}')
+            if source_vnet is not None and not isinstance(source_vnet, str):
+                raise ValueError(f'{source_vnet!r} is not a VNet name or id')
+        except ValueError as e:
+            result.update(status='Invalid', reason=str(e))
+            return result
+        protocol = protocol.strip().upper()
+        hops = result['hops']
+
+        def finish(status, reason):
+            result.update(status=status, reason=reason)
+            return result
+
+        def nsg_hop(subnet, direction, flow='the flow'):
+            """Record the subnet's NSG verdict on the last hop; returns the finished result unless it allows the flow."""
+            allowed, nsg_name, rule_name, unresolved = self.check_nsg(subnet, direction, protocol, str(source), str(destination), port)
+            if nsg_name:
+                hops[-1]['nsg_' + direction.lower()] = {'nsg_name': nsg_name, 'rule_name': rule_name, 'allowed': allowed, 'unresolved_rule_name': unresolved}
+            if allowed is None:
+                return finish('Unknown', f'{direction} NSG {nsg_name} on {subnet.get("name")} applies rule {rule_name} to {flow} '
+                                         f'unless rule {unresolved} matches it through a service tag the snapshot cannot resolve')
+            if not allowed:
+                return finish('Denied', f'{direction} NSG {nsg_name} on {subnet.get("name")} denies {flow} (rule {rule_name})')
+            return None
+
+        candidates = self.subnets_at(source)
+        if source_vnet:
+            candidates = [c for c in candidates if (self.vnet_of(c) or {}).get('name') == source_vnet or _key(c.get('id')).split('/subnets/')[0] == _key(source_vnet)]
+        if not candidates:
+            return finish('Unknown', f'No subnet in the snapshot contains source {source}' + (f' in {source_vnet}' if source_vnet else ''))
+        if len(candidates) > 1:
+            names = ', '.join(f'{(self.vnet_of(c) or {}).get("name")}/{c.get("name")}' for c in candidates)
+            return finish('Ambiguous', f'Source {source} is in several subnets of overlapping VNets ({names}); pick the source VNet')
+        source_subnet = subnet = candidates[0]
+
+        visited = set()
+        arrival = None
+        for _ in range(MAX_HOPS):
+            subnet_id = _key(subnet.get('id'))
+            if subnet_id in visited:
+                return finish('Loop', f'Routing loop through subnet {subnet.get("name")}')
+            visited.add(subnet_id)
+
+            vnet = self.vnet_of(subnet) or {}
+            route = self.forwarding_table(subnet).lookup(destination) or {'source': 'Default', 'next_hop_type': 'None'}
+            if arrival is None:
+                hops.append({'hop': len(hops) + 1, 'subnet': subnet.get('name'), 'vnet': vnet.get('name')})
+            # A subnet entered through an appliance routes onward from its arrival hop
+            arrival = None
+            hops[-1].update({
+                'route_source': route.get('source'),
+                'route_name': route.get('name'),
+                'route_table_name': route.get('route_table_name'),
+                'address_prefix': route.get('address_prefix'),
+                'next_hop_type': route.get('next_hop_type'),
+                'next_hop_ip_address': route.get('next_hop_ip_address'),
+            })
+            blocked = nsg_hop(subnet, 'Outbound')
+            if blocked:
+                return blocked
+
+            next_hop_type = route.get('next_hop_type')
+            if next_hop_type in ('VnetLocal', 'VNetPeering'):
+                if next_hop_type == 'VNetPeering':
+                    target_vnet_id = _key((route['peering'].get('remote_virtual_network') or {}).get('id'))
+                else:
+                    target_vnet_id = _key(vnet.get('id')) or subnet_id.split('/subnets/')[0]
+                target = self.subnet_in(target_vnet_id, destination)
+                if target is None:
+                    target_vnet = (self.vnets.get(target_vnet_id) or {}).get('name') or target_vnet_id
+                    return finish('Unknown', f'No subnet of {target_vnet} in the snapshot contains destination {destination}')
+                if next_hop_type == 'VNetPeering' and not route['peering'].get('allow_virtual_network_access', True):
+                    return finish('Denied', f'Peering {route["peering"].get("name")} does not allow virtual network access')
+                if not self._forwarding_allowed(subnet, target, source_subnet):
+                    return finish('Denied', f'Peering into {(self.vnet_of(target) or {}).get("name")} does not allow forwarded traffic')
+                hops.append({'hop': len(hops) + 1, 'subnet': target.get('name'), 'vnet': (self.vnet_of(target) or {}).get('name'), 'next_hop_type': 'Destination'})
+                blocked = nsg_hop(target, 'Inbound')
+                if blocked:
+                    return blocked
+                return finish('Delivered', f'Delivered to {target.get("name")}')
+
+            if next_hop_type == 'VirtualAppliance':
+                appliance_ip = route.get('next_hop_ip_address')
+                try:
+                    appliance = self.locate(subnet, ipaddress.ip_address(appliance_ip))
+                except ValueError:
+                    appliance = None
+                if appliance is None:
+                    return finish('Unknown', f'Virtual appliance {appliance_ip} is not in a subnet of {vnet.get("name")} or its peered VNets')
+                if not self._forwarding_allowed(subnet, appliance, source_subnet):
+                    return finish('Denied', f'Peering into {(self.vnet_of(appliance) or {}).get("name")} does not allow forwarded traffic')
+                delivered = ipaddress.ip_address(appliance_ip) == destination
+                arrival = {'hop': len(hops) + 1, 'subnet': appliance.get('name'), 'vnet': (self.vnet_of(appliance) or {}).get('name'), 'next_hop_type': 'Destination'}
+                hops.append(arrival)
+                blocked = nsg_hop(appliance, 'Inbound', f'the flow to appliance {appliance_ip}')
+                if blocked:
+                    return blocked
+                if delivered:
+                    return finish('Delivered', f'Delivered to appliance {appliance_ip}')
+                subnet = appliance
+                continue
+
+            if next_hop_type == 'VirtualNetworkGateway':
+                gateways = self.gateway_for(_key(vnet.get('id')))
+                if not gateways:
+                    return finish('Dropped', f'Route {route.get("name") or route.get("address_prefix")} points to a gateway but {vnet.get("name")} has none')
+                return finish('Gateway', 'Leaves Azure through ' + ', '.join(g.get('name') for g in gateways))
+
+            if next_hop_type == 'Internet':
+                return finish('Internet', 'Leaves Azure to the Internet')
+
+            return finish('Dropped', f'No route to {destination} (next hop None)')
+
+        return finish('Loop', f'Exceeded {MAX_HOPS} hops')
+
+    def _forwarding_allowed(self, from_subnet, to_subnet, source_subnet):
+        """Traffic a VNet did not originate may only cross a peering that allows forwarded traffic."""
+        from_vnet = _key(from_subnet.get('id')).split('/subnets/')[0]
+        to_vnet = _key(to_subnet.get('id')).split('/subnets/')[0]
+        if from_vnet == to_vnet:
+            return True
+        if _key(source_subnet.get('id')).split('/subnets/')[0] == from_vnet:
+            return True
+        for peering in self.peerings.get(to_vnet, []):
+            if _key((peering.get('remote_virtual_network') or {}).get('id')) == from_vnet:
+                return bool(peering.get('allow_forwarded_traffic'))
+        return True
+
+    def trace_many(self, pairs, protocol='TCP', port=443, source_vnet=None):
+        """
+        Batch mode: trace (source, destination[, protocol[, port[, source_vnet]]]) tuples; protocol, port and
+        source_vnet are the defaults for the fields a tuple leaves out.
+        """
+        results = []
+        for pair in pairs:
+            if not isinstance(pair, (list, tuple)) or not 2 <= len(pair) <= 5:
+                results.append({'source': None, 'destination': None, 'protocol': protocol, 'port': port, 'hops': [],
+                                'status': 'Invalid', 'reason': 'Expected [source, destination[, protocol[, port[, source_vnet]]]]'})
+                continue
+            fields = list(pair) + [protocol, port, source_vnet][len(pair) - 2:]
+            results.append(self.trace(*fields))
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_trace_index(data):
+    """Return the TraceIndex for this snapshot, rebuilding it when the snapshot object changes."""
+    global _index
+    index = _index
+    if index is None or index.data is not data:
+        with _index_lock:
+            if _index is None or _index.data is not data:
+                _index = TraceIndex(data)
+            index = _index
+    return index
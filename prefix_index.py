@@ -0,0 +1,215 @@
+"""
+IP/prefix search index over the whole inventory.
+
+Indexed: VNet address_space.address_prefixes, subnet prefixes, route address_prefix, virtual
+appliance next hop IPs and gateway IPs (private, BGP peering and tunnel addresses).
+
+Every entry is a CIDR, so two entries are either nested or disjoint. The index keeps
+- one dict per prefix length, keyed by the network bits (a flattened radix tree), so the
+  entries containing a point are found with at most one probe per length in use, and
+- a sorted list of entry start addresses, so entries inside a range are found by bisection.
+A range query is the union of both: everything containing its first address, plus
+everything that starts inside it.
+
+IPv4 and IPv6 share the 128-bit space from nsg_rules (IPv4 is mapped into ::ffff:0:0/96).
+
+update() diffs the new snapshot against the indexed one per resource, so a refresh only
+touches resources that changed.
+"""
+import bisect
+import ipaddress
+import threading
+
+from nsg_rules import IPV4_MAPPED
+from path_trace import subnet_prefixes
+
+
+def _network(value):
+    """Return (first, last, length) of an IP or CIDR in the shared 128-bit space, or None."""
+    try:
+        network = ipaddress.ip_network(str(value).strip(), strict=False)
+    except ValueError:
+        return None
+    first, last = int(network.network_address), int(network.broadcast_address)
+    length = network.prefixlen
+    if network.version == 4:
+        first, last, length = first + IPV4_MAPPED, last + IPV4_MAPPED, length + 96
+    return first, last, length
+
+
+def parse_query(query):
+    """Parse '10.0.0.4', '10.0.0.0/24' or '10.0.0.0-10.0.3.255' into a (first, last) interval, or None."""
+    query = (query or '').strip()
+    if '-' in query:
+        low, high = (_network(part) for part in query.split('-', 1))
+        if low and high and low[0] <= high[1]:
+            return low[0], high[1]
+        return None
+    network = _network(query)
+    return (network[0], network[1]) if network else None
+
+
+def resource_entries(data):
+    """Yield (resource_key, entries) for every indexable resource in the snapshot."""
+    for vnet in data.get('vnets', []):
+        yield ('vnet', vnet.get('id')), [
+            {'kind': 'vnet', 'prefix': prefix, 'name': vnet.get('name'), 'id': vnet.get('id'),
+             'subscription_id': vnet.get('subscription_id'), 'context': vnet.get('resource_group_name')}
+            for prefix in (vnet.get('address_space') or {}).get('address_prefixes') or []
+        ]
+
+    for subnet in data.get('subnets', []):
+        yield ('subnet', subnet.get('id')), [
+            {'kind': 'subnet', 'prefix': prefix, 'name': subnet.get('name'), 'id': subnet.get('id'),
+             'subscription_id': subnet.get('subscription_id'), 'context': subnet.get('virtual_network_name')}
+            for prefix in subnet_prefixes(subnet)
+        ]
+
+    for route_table in data.get('route_tables', []):
+        for route in route_table.get('routes') or []:
+            entries = [{'kind': 'route', 'prefix': route.get('address_prefix'), 'name': route.get('name'), 'id': route.get('id'),
+                        'subscription_id': route_table.get('subscription_id'),
+                        'context': f"{route_table.get('name')} -> {route.get('next_hop_type')} {route.get('next_hop_ip_address') or ''}".strip()}]
+            if route.get('next_hop_type') == 'VirtualAppliance' and route.get('next_hop_ip_address'):
+                entries.append({'kind': 'appliance', 'prefix': route['next_hop_ip_address'], 'name': route.get('name'), 'id': route.get('id'),
+                                'subscription_id': route_table.get('subscription_id'), 'context': f"next hop of {route_table.get('name')}/{route.get('name')}"})
+            # Routes added by hand or by a what-if edit may have no id yet
+            yield ('route', route.get('id') or (route_table.get('id'), route.get('name'))), entries
+
+    for gateway in data.get('vnet_gateways', []):
+        addresses = [c.get('private_ip_address') for c in gateway.get('ip_configurations') or []]
+        bgp = gateway.get('bgp_settings') or {}
+        addresses.extend((bgp.get('bgp_peering_address') or '').split(','))
+        for peering_address in bgp.get('bgp_peering_addresses') or []:
+            addresses.extend(peering_address.get('default_bgp_ip_addresses') or [])
+            addresses.extend(peering_address.get('custom_bgp_ip_addresses') or [])
+            addresses.extend(peering_address.get('tunnel_ip_addresses') or [])
+        seen = []
+        for address in addresses:
+            address = (address or '').strip()
+            if address and address not in seen:
+                seen.append(address)
+        yield ('gateway', gateway.get('id')), [
+            {'kind': 'gateway', 'prefix': address, 'name': gateway.get('name'), 'id': gateway.get('id'),
+             'subscription_id': gateway.get('subscription_id'), 'context': gateway.get('gateway_type')}
+            for address in seen
+        ]
+
+
+class PrefixIndex:
+    """Point and range lookups over every prefix in the snapshot, updated incrementally."""
+
+    def __init__(self, data=None):
+        self.data = None
+        self._entries = {}        # entry id -> (first, last, length, entry)
+        self._by_length = {}      # length -> {first >> (128 - length): [entry id, ...]}
+        self._lengths = []        # lengths in use, longest first
+        self._starts = []         # sorted (first, entry id)
+        self._resources = {}      # resource key -> (entries, [entry id, ...])
+        self._next_id = 0
+        self._lock = threading.Lock()
+        if data is not None:
+            self.update(data)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add(self, entry, bulk):
+        network = _network(entry.get('prefix'))
+        if network is None:
+            return None
+        first, last, length = network
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (first, last, length, entry)
+        bucket = self._by_length.get(length)
+        if bucket is None:
+            bucket = self._by_length[length] = {}
+            self._lengths = sorted(self._by_length, reverse=True)
+        bucket.setdefault(first >> (128 - length), []).append(entry_id)
+        if not bulk:
+            bisect.insort(self._starts, (first, entry_id))
+        return entry_id
+
+    def _remove(self, entry_id, bulk):
+        first, last, length, _ = self._entries.pop(entry_id)
+        bucket = self._by_length[length]
+        key = first >> (128 - length)
+        bucket[key].remove(entry_id)
+        if not bucket[key]:
+            del bucket[key]
+        if not bucket:
+            del self._by_length[length]
+            self._lengths = sorted(self._by_length, reverse=True)
+        if not bulk:
+            index = bisect.bisect_left(self._starts, (first, entry_id))
+            del self._starts[index]
+
+    def update(self, data):
+        """Re-index only the resources whose indexed fields changed since the last update. Returns the number of changed resources."""
+        fresh = dict(resource_entries(data))
+        with self._lock:
+            return self._apply(data, fresh)
+
+    def _apply(self, data, fresh):
+        changed = [key for key in self._resources if key not in fresh or fresh[key] != self._resources[key][0]]
+        changed += [key for key in fresh if key not in self._resources]
+        # Large refreshes re-sort once instead of inserting one entry at a time
+        bulk = len(changed) > max(64, len(self._resources) // 8)
+
+        for key in changed:
+            if key in self._resources:
+                for entry_id in self._resources.pop(key)[1]:
+                    self._remove(entry_id, bulk)
+            if key in fresh:
+                ids = [self._add(entry, bulk) for entry in fresh[key]]
+                self._resources[key] = (fresh[key], [i for i in ids if i is not None])
+
+        if bulk:
+            self._starts = sorted((first, entry_id) for entry_id, (first, _, _, _) in self._entries.items())
+        self.data = data
+        return len(changed)
+
+    def _containing(self, first):
+        for length in self._lengths:
+            for entry_id in self._by_length[length].get(first >> (128 - length), ()):
+                yield entry_id
+
+    def search(self, query):
+        """
+        Entries matching an IP (every prefix containing it), a CIDR or an 'a-b' range (every prefix
+        overlapping it), most specific first. Returns None if the query cannot be parsed.
+        """
+        interval = parse_query(query)
+        if interval is None:
+            return None
+        with self._lock:
+            return self._search(*interval)
+
+    def _search(self, first, last):
+        matches = list(self._containing(first))
+        if last > first:
+            seen = set(matches)
+            index = bisect.bisect_left(self._starts, (first, -1))
+            while index < len(self._starts) and self._starts[index][0] <= last:
+                entry_id = self._starts[index][1]
+                if entry_id not in seen:
+                    matches.append(entry_id)
+                index += 1
+        matches.sort(key=lambda entry_id: (-self._entries[entry_id][2], self._entries[entry_id][0]))
+        return [self._entries[entry_id][3] for entry_id in matches]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prefix_index(data):
+    """Return the shared PrefixIndex, incrementally updated when the snapshot object changes."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PrefixIndex(data)
+        elif _index.data is not data:
+            _index.update(data)
+        return _index
@@ -0,0 +1,364 @@
+"""
+Compact in-memory representation of the environment snapshot.
+
+json.load() gives every resource its own dict, and every string its own object, so each of
+the (often thousands of) subnets carries private copies of its ARM ID, the route table and
+NSG IDs it references, its etag, provisioning state, type, and so on. VNets also embed a
+full copy of each of their subnets.
+
+compact_snapshot() converts the loaded JSON into:
+- Record: a read-only Mapping with two slots, a shared Shape (keys + per-key kind) and a
+  tuple of values. Records with the same keys share one Shape, so keys are stored once.
+- interned strings, and hash-consed lists and records, so equal values (etags, locations,
+  address prefix lists, duplicate route table entries) are stored once.
+- IdTable: ARM IDs are stored as integer handles into a tree of '/type/name' segments,
+  so a subnet ID costs one new segment under its (shared) VNet, and {'id': ...} references
+  to route tables, NSGs, NICs and remote VNets are stored as a bare handle (lists of them
+  as an array of handles).
+- the subnets embedded in each VNet become projections of the top-level subnet Records,
+  sharing their values instead of holding a second copy.
+
+Records behave like the original dicts for reading (get, [], in, iteration, Jinja attribute
+access), so the routes and templates work unchanged, and to_dict() rebuilds the original
+JSON exactly. Two differences to keep in mind:
+- reading an ID rebuilds its string from the segment tree, which costs about 20x a dict
+  lookup. Loops that join resources by ID should compare id_key() values (IdTable handles)
+  instead of ID strings.
+- nested lists read back as RecordList tuples, so a Record never equals the dict it was built
+  from (record == raw is False even for equal content). Compare record.to_dict() == raw.
+The snapshot is immutable; environments/environment_data.json stays the source for the JSON
+view/download.
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+
+# Value kinds stored in a Shape
+PLAIN = 0      # value as is (str, number, bool, None, Record, RecordList)
+ID = 1         # ARM ID string, stored as an IdTable handle
+REF = 2        # {'id': <ARM ID>}, stored as an IdTable handle
+REF_LIST = 3   # [{'id': <ARM ID>}, ...], stored as an array of handles
+
+RAW = -2       # IdTable parent marker for strings that are not '/type/name/...' paths
+
+
+class IdTable:
+    """Interns ARM IDs as integer handles. Each handle is a (parent handle, '/type/name' segment) pair."""
+
+    def __init__(self):
+        self.parents = array('l')
+        self.segments = []
+        self._lookup = {}   # segment -> handle, or {parent: handle} when the segment has several parents
+
+    def __len__(self):
+        return len(self.segments)
+
+    def freeze(self):
+        """Drop the reverse lookup once a build is done; intern() rebuilds it if more IDs arrive."""
+        self._lookup = None
+
+    def _child(self, parent, segment):
+        if self._lookup is None:
+            self._lookup = {}
+            for handle, (segment_parent, known) in enumerate(zip(self.parents, self.segments)):
+                self._link(segment_parent, known, handle)
+        found = self._lookup.get(segment)
+        if isinstance(found, dict):
+            handle = found.get(parent)
+        elif found is not None and self.parents[found] == parent:
+            handle = found
+        else:
+            handle = None
+        if handle is None:
+            if found is not None:
+                # Reuse the stored string for segments repeated under many parents ('/ipConfigurations/ipconfig1')
+                segment = self.segments[next(iter(found.values())) if isinstance(found, dict) else found]
+            handle = len(self.segments)
+            self.parents.append(parent)
+            self.segments.append(segment)
+            self._link(parent, segment, handle)
+        return handle
+
+    def _link(self, parent, segment, handle):
+        found = self._lookup.get(segment)
+        if found is None:
+            self._lookup[segment] = handle
+        elif isinstance(found, dict):
+            found[parent] = handle
+        else:
+            self._lookup[segment] = {self.parents[found]: found, parent: handle}
+
+    def intern(self, value):
+        parts = value.split('/')
+        if len(parts) < 3 or parts[0] != '' or '' in parts[1:]:
+            return self._child(RAW, value)
+        handle = -1
+        for i in range(1, len(parts), 2):
+            handle = self._child(handle, '/' + '/'.join(parts[i:i + 2]))
+        return handle
+
+    def __getitem__(self, handle):
+        parent = self.parents[handle]
+        if parent == RAW:
+            return self.segments[handle]
+        segments = []
+        while handle >= 0:
+            segments.append(self.segments[handle])
+            handle = self.parents[handle]
+        return ''.join(reversed(segments))
+
+
+class Shape:
+    """Keys of a Record and the kind of each value; shared by every Record with the same layout."""
+
+    __slots__ = ('keys', 'kinds', 'index', 'ids')
+
+    def __init__(self, keys, kinds, ids, index=None):
+        self.keys = keys
+        self.kinds = kinds
+        # A projection shape exposes a subset of another shape's keys over that shape's values
+        self.index = index if index is not None else {key: i for i, key in enumerate(keys)}
+        self.ids = ids
+
+
+class RecordList(tuple):
+    """Immutable list of values; prints like a list so templates render it the same way."""
+
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        item = tuple.__getitem__(self, index)
+        return RecordList(item) if isinstance(index, slice) else item
+
+    def __add__(self, other):
+        return RecordList(tuple(self) + tuple(other))
+
+    def __radd__(self, other):
+        return RecordList(tuple(other) + tuple(self))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    __str__ = __repr__
+
+
+class Record(Mapping):
+    """Read-only dict replacement. Values are decoded on access according to the Shape."""
+
+    __slots__ = ('_shape', '_values')
+
+    def __init__(self, shape, values):
+        self._shape = shape
+        self._values = values
+
+    def __getitem__(self, key):
+        shape = self._shape
+        i = shape.index[key]
+        kind = shape.kinds[i]
+        value = self._values[i]
+        if kind == PLAIN:
+            return value
+        if kind == ID:
+            return shape.ids[value]
+        if kind == REF:
+            return {'id': shape.ids[value]}
+        return [{'id': shape.ids[handle]} for handle in value]
+
+    def __iter__(self):
+        return iter(self._shape.keys)
+
+    def __len__(self):
+        return len(self._shape.keys)
+
+    def __contains__(self, key):
+        return key in self._shape.index
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def handle(self, key):
+        """IdTable handle of an ID or {'id': ...} value, or None for other values. Equal handles mean equal IDs."""
+        i = self._shape.index.get(key)
+        if i is None or self._shape.kinds[i] not in (ID, REF):
+            return None
+        return self._values[i]
+
+    def to_dict(self):
+        """Rebuild the original JSON-compatible dict."""
+        return {key: to_plain(self[key]) for key in self._shape.keys}
+
+
+def to_plain(value):
+    """Convert Records and RecordLists (at any depth) back to dicts and lists."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, (RecordList, list)):
+        return [to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    return value
+
+
+def id_key(record, key='id'):
+    """
+    Cheap comparison key for the ARM ID in record[key] (an ID, or a {'id': ...} reference): the
+    IdTable handle for Records, the ID string otherwise. Only compare keys from the same snapshot.
+    """
+    if isinstance(record, Record):
+        handle = record.handle(key)
+        if handle is not None:
+            return handle
+    value = record.get(key)
+    if key != 'id' and isinstance(value, Mapping):
+        return id_key(value)
+    return value
+
+
+def _is_arm_id(value):
+    return isinstance(value, str) and value.startswith('/subscriptions/')
+
+
+def _is_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and _is_arm_id(value.get('id'))
+
+
+class _Builder:
+    """Converts loaded JSON into Records. The hash-consing caches only live for one build."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.shapes = {}
+        self.values = {}
+        self.strings = {}
+
+    def _cons(self, kind, items, make):
+        # Records are unhashable like dicts. Children are consed before their parents, so a
+        # child's identity stands for its value in the cache key. Plain values carry their
+        # type so True, 1 and 1.0 are not merged.
+        key = (kind, tuple(('#', id(v)) if isinstance(v, (Record, RecordList, array)) else (type(v), v) for v in items))
+        value = self.values.get(key)
+        if value is None:
+            value = self.values[key] = make()
+        return value
+
+    def convert(self, value):
+        if isinstance(value, str):
+            # Local intern table, freed with the builder (sys.intern would keep every name alive for good)
+            return self.strings.setdefault(value, value)
+        if isinstance(value, dict):
+            return self.record(value)
+        if isinstance(value, list):
+            items = tuple(self.convert(v) for v in value)
+            return self._cons(RecordList, items, lambda: RecordList(items))
+        return value
+
+    def record(self, data):
+        keys, kinds, values = [], [], []
+        for key, value in data.items():
+            keys.append(sys.intern(key))
+            if key == 'id' and _is_arm_id(value):
+                kinds.append(ID)
+                values.append(self.ids.intern(value))
+            elif _is_ref(value):
+                kinds.append(REF)
+                values.append(self.ids.intern(value['id']))
+            elif isinstance(value, list) and value and all(_is_ref(v) for v in value):
+                kinds.append(REF_LIST)
+                handles = tuple(self.ids.intern(v['id']) for v in value)
+                values.append(self._cons(array, handles, lambda: array('l', handles)))
+            else:
+                kinds.append(PLAIN)
+                values.append(self.convert(value))
+        shape_key = (tuple(keys), tuple(kinds))
+        shape = self.shapes.get(shape_key)
+        if shape is None:
+            shape = self.shapes[shape_key] = Shape(shape_key[0], shape_key[1], self.ids)
+        values = tuple(values)
+        return self._cons(shape, values, lambda: Record(shape, values))
+
+
+class Snapshot(Mapping):
+    """Top-level environment data: resource lists of Records keyed like environment_data.json."""
+
+    __slots__ = ('_data', 'ids')
+
+    def __init__(self, data, ids):
+        self._data = data
+        self.ids = ids
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'Snapshot({", ".join(f"{k}={len(v)}" for k, v in self._data.items())})'
+
+    def to_dict(self):
+        """Rebuild the original environment_data.json structure."""
+        return {key: to_plain(value) for key, value in self._data.items()}
+
+
+def _share_embedded(compact, ids):
+    """
+    Replace nested copies of top-level resources (a VNet's 'subnets') with projections of the
+    top-level Record: same values tuple, shape limited to the nested copy's keys.
+    """
+    by_handle = {}
+    for records in compact.values():
+        for record in records:
+            if isinstance(record, Record) and 'id' in record and record._shape.kinds[record._shape.index['id']] == ID:
+                by_handle[record._values[record._shape.index['id']]] = record
+    projections = {}
+
+    def project(child):
+        if not isinstance(child, Record) or 'id' not in child or child._shape.kinds[child._shape.index['id']] != ID:
+            return child
+        parent = by_handle.get(child._values[child._shape.index['id']])
+        if parent is None or parent is child:
+            return child
+        for key, kind, value in zip(child._shape.keys, child._shape.kinds, child._values):
+            i = parent._shape.index.get(key)
+            if i is None or parent._shape.kinds[i] != kind or not (parent._values[i] is value or parent._values[i] == value):
+                return child
+        shape_key = (id(parent._shape), child._shape.keys)
+        shape = projections.get(shape_key)
+        if shape is None:
+            index = {key: parent._shape.index[key] for key in child._shape.keys}
+            shape = projections[shape_key] = Shape(child._shape.keys, parent._shape.kinds, ids, index)
+        return Record(shape, parent._values)
+
+    for key, records in compact.items():
+        if not isinstance(records, RecordList) or key == 'subscriptions':
+            continue
+        updated = []
+        for record in records:
+            if isinstance(record, Record):
+                values = tuple(
+                    RecordList(project(item) for item in value) if isinstance(value, RecordList) and value and isinstance(value[0], Record) else value
+                    for value in record._values
+                )
+                if any(new is not old for new, old in zip(values, record._values)):
+                    record = Record(record._shape, values)
+            updated.append(record)
+        compact[key] = RecordList(updated)
+
+
+def compact_snapshot(data):
+    """Convert environment data loaded from JSON into a compact, read-only Snapshot."""
+    ids = IdTable()
+    builder = _Builder(ids)
+    compact = {}
+    for key, value in (data or {}).items():
+        if key == 'subscriptions':
+            # Small list of [id, name] pairs that templates unpack; keep as tuples
+            compact[key] = RecordList(RecordList(builder.convert(v) for v in sub) if isinstance(sub, list) else builder.convert(sub) for sub in value)
+        else:
+            compact[sys.intern(key)] = builder.convert(value)
+    _share_embedded(compact, ids)
+    ids.freeze()
+    return Snapshot(compact, ids)
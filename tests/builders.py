@@ -0,0 +1,63 @@
+"""Small synthetic environments for the NSG, trace and what-if tests."""
+
+SUB = '/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg/providers/Microsoft.Network'
+
+
+def rule(name, priority, access, source='*', destination='*', port='*', protocol='Tcp', direction='Inbound'):
+    return {'name': name, 'priority': priority, 'direction': direction, 'access': access, 'protocol': protocol,
+            'source_address_prefix': source, 'destination_address_prefix': destination,
+            'source_port_range': '*', 'destination_port_range': port}
+
+
+# The default rules Azure adds to every NSG
+DEFAULT_RULES = [
+    rule('AllowVnetInBound', 65000, 'Allow', 'VirtualNetwork', 'VirtualNetwork', protocol='*'),
+    rule('AllowAzureLoadBalancerInBound', 65001, 'Allow', 'AzureLoadBalancer', protocol='*'),
+    rule('DenyAllInBound', 65500, 'Deny', protocol='*'),
+    rule('AllowVnetOutBound', 65000, 'Allow', 'VirtualNetwork', 'VirtualNetwork', protocol='*', direction='Outbound'),
+    rule('AllowInternetOutBound', 65001, 'Allow', '*', 'Internet', protocol='*', direction='Outbound'),
+    rule('DenyAllOutBound', 65500, 'Deny', protocol='*', direction='Outbound'),
+]
+
+
+def nsg(name, *rules):
+    """An NSG with the given custom rules and Azure's default rules."""
+    return {'id': f'{SUB}/networkSecurityGroups/{name}', 'name': name,
+            'security_rules': list(rules), 'default_security_rules': [dict(r) for r in DEFAULT_RULES]}
+
+
+def vnet(name, prefix):
+    return {'id': f'{SUB}/virtualNetworks/{name}', 'name': name, 'resource_group_name': 'rg', 'address_space': {'address_prefixes': [prefix]}}
+
+
+def subnet(vnet_name, name, prefix, nsg=None, route_table=None):
+    record = {'id': f'{SUB}/virtualNetworks/{vnet_name}/subnets/{name}', 'name': name, 'address_prefix': prefix, 'virtual_network_name': vnet_name}
+    if nsg:
+        record['network_security_group'] = {'id': nsg['id']}
+    if route_table:
+        record['route_table'] = {'id': route_table['id']}
+    return record
+
+
+def peering(local, remote, **flags):
+    record = {'id': f'{local["id"]}/virtualNetworkPeerings/{local["name"]}-to-{remote["name"]}', 'name': f'{local["name"]}-to-{remote["name"]}',
+              'virtual_network_name': local['name'], 'resource_group_name': 'rg', 'peering_state': 'Connected',
+              'remote_virtual_network': {'id': remote['id']}, 'remote_address_space': remote['address_space'],
+              'allow_virtual_network_access': True, 'allow_forwarded_traffic': True}
+    record.update(flags)
+    return record
+
+
+def hub_and_spoke(firewall_nsg=None, spoke_nsg=None):
+    hub, spoke = vnet('vnet-hub', '10.0.0.0/22'), vnet('vnet-spoke', '10.1.0.0/24')
+    route_table = {'id': f'{SUB}/routeTables/rt-spoke', 'name': 'rt-spoke', 'routes': [
+        {'name': 'default', 'address_prefix': '0.0.0.0/0', 'next_hop_type': 'VirtualAppliance', 'next_hop_ip_address': '10.0.0.4'}]}
+    return {
+        'vnets': [hub, spoke],
+        'subnets': [subnet('vnet-hub', 'AzureFirewallSubnet', '10.0.0.0/26', nsg=firewall_nsg),
+                    subnet('vnet-spoke', 'snet-app', '10.1.0.0/26', nsg=spoke_nsg, route_table=route_table)],
+        'route_tables': [route_table],
+        'nsgs': [group for group in (firewall_nsg, spoke_nsg) if group],
+        'peerings': [peering(hub, spoke), peering(spoke, hub)],
+        'vnet_gateways': [],
+    }
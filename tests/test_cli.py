@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from builders import hub_and_spoke, nsg, rule
+from cli import EXIT_ERROR, EXIT_FINDINGS, EXIT_OK, format_markdown, main, run_validation
+from snapshot_model import compact_snapshot
+
+
+def environment():
+    # sub-hub holds the hub and its clean NSG; sub-spoke holds the spoke and its route table via the firewall at 10.0.0.4
+    data = hub_and_spoke(firewall_nsg=nsg('nsg-firewall'))
+    hub_id = data['vnets'][0]['id'].lower()
+    for key in ('vnets', 'subnets', 'route_tables', 'nsgs', 'peerings'):
+        for record in data[key]:
+            record['subscription_id'] = 'sub-hub' if record['id'].lower().startswith(hub_id) or key == 'nsgs' else 'sub-spoke'
+    data['subscriptions'] = [['sub-hub', 'Hub'], ['sub-spoke', 'Spoke']]
+    return data
+
+
+@pytest.fixture
+def environment_file(tmp_path):
+    path = tmp_path / 'environment_data.json'
+    path.write_text(json.dumps(environment()))
+    return str(path)
+
+
+@pytest.mark.parametrize('extra, expected', [
+    (['--firewall-ip', '10.0.0.4'], EXIT_OK),
+    (['--firewall-ip', '10.0.0.5'], EXIT_FINDINGS),
+    (['--firewall-ip', '10.0.0.5', '--no-fail'], EXIT_OK),
+    (['--firewall-ip', '10.0.0.5', '--subscription', 'sub-hub'], EXIT_OK),
+])
+def test_validate_exit_codes(environment_file, tmp_path, extra, expected):
+    output = str(tmp_path / 'result.json')
+    assert main(['validate', '--environment', environment_file, '--output', output, '--quiet'] + extra) == expected
+    findings = sum(len(sub['issues']) for sub in json.load(open(output))['subscriptions'])
+    assert bool(findings) == ('10.0.0.5' in extra and '--subscription' not in extra)
+
+
+def test_missing_environment_file_is_an_error(tmp_path):
+    assert main(['validate', '--environment', str(tmp_path / 'missing.json'), '--quiet']) == EXIT_ERROR
+
+
+def test_run_validation_filters_subscriptions():
+    data = compact_snapshot(environment())
+    result = run_validation(data, ['sub-spoke'], '10.0.0.5')
+    assert [sub['subscription_id'] for sub in result['subscriptions']] == ['sub-spoke']
+    assert [issue['route_name'] for issue in result['subscriptions'][0]['issues']] == ['default']
+    assert len(run_validation(data, None, '10.0.0.5')['subscriptions']) == 2
+
+
+def test_markdown_lists_findings_per_subscription():
+    markdown = format_markdown(run_validation(compact_snapshot(environment()), None, '10.0.0.5'))
+    lines = markdown.splitlines()
+    assert lines[0] == '# routeValidator validation'
+    hub, spoke = lines.index('## Hub (sub-hub)'), lines.index('## Spoke (sub-spoke)')
+    assert lines[hub + 2] == 'No findings.'
+    table = [[cell.strip() for cell in line.strip('|').split('|')] for line in lines[spoke + 2:spoke + 5]]
+    assert table[0] == ['Resource', 'Route / Rule', 'Finding']
+    assert set(''.join(table[1])) <= set('-: ')
+    assert table[2] == ['rt-spoke', 'default', 'has an incorrect next hop IP address: 10.0.0.4']
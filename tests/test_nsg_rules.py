@@ -0,0 +1,60 @@
+from builders import nsg, rule, subnet, vnet
+from nsg_rules import compile_nsg, vnet_service_tags
+from validation import validate_routes
+
+
+def anomaly_rules(compiled):
+    return {(a['rule_name'], a['kind']) for a in compiled.anomalies}
+
+
+def test_unresolved_tag_deny_is_not_redundant_when_an_allow_overlaps_it():
+    # Removing the deny would open SSH to 203.0.113.0/24, so it must not be reported as redundant
+    compiled = compile_nsg(nsg('nsg-test', rule('DenyInternetSsh', 100, 'Deny', 'Internet', port='22'), rule('AllowPartnerSsh', 200, 'Allow', '203.0.113.0/24', port='22')))
+    assert ('DenyInternetSsh', 'redundant') not in anomaly_rules(compiled)
+
+
+def test_deny_redundant_with_deny_all_when_nothing_in_between():
+    # Only DenyAllInBound; the AzureLoadBalancer allow before it would overlap the unresolved Internet tag
+    group = nsg('nsg-test', rule('DenyInternetSsh', 100, 'Deny', 'Internet', port='22'))
+    group['default_security_rules'] = [r for r in group['default_security_rules'] if r['name'] == 'DenyAllInBound']
+    compiled = compile_nsg(group)
+    assert ('DenyInternetSsh', 'redundant') in anomaly_rules(compiled)
+
+
+def test_allow_by_ip_shadowed_by_earlier_deny_all():
+    compiled = compile_nsg(nsg('nsg-test', rule('DenySsh', 100, 'Deny', port='22'), rule('AllowPartnerSsh', 200, 'Allow', '203.0.113.0/24', port='22')))
+    assert ('AllowPartnerSsh', 'shadowed') in anomaly_rules(compiled)
+
+
+def test_validate_routes_resolves_virtual_network_tag():
+    # AllowVnetInBound covers 10.0.1.0/24 only once VirtualNetwork is known to be 10.0.0.0/16
+    group = nsg('nsg-test', rule('AllowAppSubnet', 4000, 'Allow', '10.0.1.0/24', '10.0.2.0/24', protocol='*'))
+    subnets = [subnet('vnet-test', 'snet-test', '10.0.0.0/16', nsg=group)]
+    without_vnets = validate_routes(subnets, [], [group], None)
+    with_vnets = validate_routes(subnets, [], [group], None, [vnet('vnet-test', '10.0.0.0/16')], [])
+    assert not [i for i in without_vnets if i['rule_name'] == 'AllowAppSubnet']
+    assert [i for i in with_vnets if i['rule_name'] == 'AllowAppSubnet' and 'AllowVnetInBound' in i['description']]
+
+
+def test_nsg_listed_once_per_subnet_is_reported_once():
+    group = nsg('nsg-test', rule('DenySsh', 100, 'Deny', port='22'), rule('AllowPartnerSsh', 200, 'Allow', '203.0.113.0/24', port='22'))
+    issues = validate_routes([], [], [group, dict(group)], None)
+    assert [i['rule_name'] for i in issues] == ['AllowPartnerSsh']
+
+
+def test_default_outbound_rules_resolve_internet_and_virtual_network():
+    compiled = compile_nsg(nsg('nsg-test'), vnet_service_tags(vnet('vnet-test', '10.0.0.0/16'), []))
+    assert compiled.evaluate('Outbound', 'TCP', '10.0.0.4', '8.8.8.8', 443)['name'] == 'AllowInternetOutBound'
+    assert compiled.evaluate('Outbound', 'TCP', '10.0.0.4', '10.0.1.4', 443)['name'] == 'AllowVnetOutBound'
+    assert compiled.evaluate('Outbound', 'TCP', '10.0.0.4', '192.168.1.1', 443)['name'] == 'DenyAllOutBound'
+    assert compiled.evaluate('Inbound', 'TCP', '168.63.129.16', '10.0.0.4', 443)['name'] == 'AllowAzureLoadBalancerInBound'
+
+
+def test_verdict_depending_on_an_unresolved_tag_is_reported():
+    group = nsg('nsg-test', rule('AllowStorage', 100, 'Allow', destination='Storage', direction='Outbound'),
+                rule('DenyPublic', 200, 'Deny', destination='8.0.0.0/7', direction='Outbound'))
+    compiled = compile_nsg(group, vnet_service_tags(vnet('vnet-test', '10.0.0.0/16'), []))
+    rule_found, unresolved = compiled.decide('Outbound', 'TCP', '10.0.0.4', '8.8.8.8', 443)
+    assert (rule_found['name'], unresolved['name']) == ('DenyPublic', 'AllowStorage')
+    # The same access further up cannot change the verdict
+    assert compiled.decide('Outbound', 'TCP', '10.0.0.4', '1.1.1.1', 443) == (compiled.evaluate('Outbound', 'TCP', '10.0.0.4', '1.1.1.1', 443), None)
@@ -0,0 +1,124 @@
+import pytest
+
+from builders import hub_and_spoke, nsg, rule, subnet, vnet
+from path_trace import TraceIndex
+
+
+def test_traffic_through_appliance_reaches_internet():
+    result = TraceIndex(hub_and_spoke()).trace('10.1.0.4', '8.8.8.8')
+    assert result['status'] == 'Internet'
+    assert [hop['subnet'] for hop in result['hops']] == ['snet-app', 'AzureFirewallSubnet']
+
+
+def test_appliance_subnet_inbound_nsg_is_checked():
+    # AllowVnetInBound does not cover a flow to the Internet
+    result = TraceIndex(hub_and_spoke(nsg('nsg-firewall'))).trace('10.1.0.4', '8.8.8.8')
+    assert result['status'] == 'Denied'
+    assert result['hops'][-1]['subnet'] == 'AzureFirewallSubnet'
+    assert result['hops'][-1]['nsg_inbound'] == {'nsg_name': 'nsg-firewall', 'rule_name': 'DenyAllInBound', 'allowed': False, 'unresolved_rule_name': None}
+
+
+def test_default_rules_allow_internet_outbound():
+    result = TraceIndex(hub_and_spoke(spoke_nsg=nsg('nsg-app'))).trace('10.1.0.4', '8.8.8.8')
+    assert result['status'] == 'Internet'
+    assert result['hops'][0]['nsg_outbound']['rule_name'] == 'AllowInternetOutBound'
+
+
+def test_default_rules_allow_virtual_network_outbound_and_inbound():
+    data = hub_and_spoke(nsg('nsg-firewall'), nsg('nsg-app'))
+    data['route_tables'][0]['routes'] = []
+    data['subnets'].append(subnet('vnet-hub', 'snet-shared', '10.0.1.0/24', nsg=data['nsgs'][0]))
+    result = TraceIndex(data).trace('10.1.0.4', '10.0.1.10')
+    assert result['status'] == 'Delivered'
+    assert (result['hops'][0]['nsg_outbound']['rule_name'], result['hops'][1]['nsg_inbound']['rule_name']) == ('AllowVnetOutBound', 'AllowVnetInBound')
+
+
+def test_on_premises_flow_behind_a_gateway_is_unknown_not_denied():
+    # The on-premises prefixes Azure adds to VirtualNetwork are not in the snapshot
+    data = hub_and_spoke(spoke_nsg=nsg('nsg-app'))
+    data['route_tables'][0]['routes'] = [{'name': 'onprem', 'address_prefix': '192.168.0.0/16', 'next_hop_type': 'VirtualNetworkGateway'}]
+    data['peerings'][1]['use_remote_gateways'] = True
+    data['subnets'].append(subnet('vnet-hub', 'GatewaySubnet', '10.0.2.0/27'))
+    data['vnet_gateways'] = [{'name': 'vgw-hub', 'ip_configurations': [{'subnet': {'id': data['subnets'][-1]['id']}}]}]
+    result = TraceIndex(data).trace('10.1.0.4', '192.168.10.5')
+    assert result['status'] == 'Unknown'
+    assert result['hops'][0]['nsg_outbound'] == {'nsg_name': 'nsg-app', 'rule_name': 'DenyAllOutBound', 'allowed': None, 'unresolved_rule_name': 'AllowVnetOutBound'}
+    # Without a gateway VirtualNetwork is fully known, so DenyAllOutBound decides
+    data['peerings'][1]['use_remote_gateways'] = False
+    assert TraceIndex(data).trace('10.1.0.4', '192.168.10.5')['status'] == 'Denied'
+
+
+def test_appliance_as_destination_checks_inbound_nsg():
+    data = hub_and_spoke(nsg('nsg-firewall', rule('DenySpoke', 100, 'Deny', '10.1.0.0/24', protocol='*')))
+    data['route_tables'][0]['routes'].append({'name': 'hub', 'address_prefix': '10.0.0.0/22', 'next_hop_type': 'VirtualAppliance', 'next_hop_ip_address': '10.0.0.4'})
+    result = TraceIndex(data).trace('10.1.0.4', '10.0.0.4')
+    assert result['status'] == 'Denied'
+    assert result['hops'][-1]['next_hop_type'] == 'Destination'
+    assert 'appliance 10.0.0.4' in result['reason']
+
+
+def with_overlapping_vnet():
+    # vnet-test reuses the hub's address space and is not peered with anything
+    data = hub_and_spoke()
+    data['vnets'].append(vnet('vnet-test', '10.0.0.0/16'))
+    data['subnets'].append(subnet('vnet-test', 'snet-test', '10.0.0.0/28'))
+    data['subnets'].append(subnet('vnet-test', 'snet-test-small', '10.0.1.64/27'))
+    data['subnets'].append(subnet('vnet-hub', 'AzureBastionSubnet', '10.0.1.64/27'))
+    return data
+
+
+def test_equal_prefixes_in_overlapping_vnets_are_both_kept():
+    index = TraceIndex(with_overlapping_vnet())
+    result = index.trace('10.0.1.70', '8.8.8.8')
+    assert result['status'] == 'Ambiguous'
+    assert 'vnet-hub/AzureBastionSubnet' in result['reason'] and 'vnet-test/snet-test-small' in result['reason']
+
+
+def test_appliance_is_found_in_the_peered_vnet():
+    # 10.0.0.4 is also in the more specific snet-test of the unpeered vnet-test
+    data = with_overlapping_vnet()
+    data['route_tables'][0]['routes'].append({'name': 'bastion', 'address_prefix': '10.0.1.64/27', 'next_hop_type': 'VirtualAppliance', 'next_hop_ip_address': '10.0.0.4'})
+    result = TraceIndex(data).trace('10.1.0.4', '10.0.1.70')
+    assert result['status'] == 'Delivered'
+    assert [(hop['vnet'], hop['subnet']) for hop in result['hops']] == [
+        ('vnet-spoke', 'snet-app'), ('vnet-hub', 'AzureFirewallSubnet'), ('vnet-hub', 'AzureBastionSubnet')]
+
+
+def test_ambiguous_source_is_reported_not_guessed():
+    result = TraceIndex(with_overlapping_vnet()).trace('10.0.0.10', '10.0.0.12')
+    assert result['status'] == 'Ambiguous'
+
+
+def test_source_vnet_picks_the_source_subnet_and_delivery_stays_in_that_vnet():
+    result = TraceIndex(with_overlapping_vnet()).trace('10.0.0.10', '10.0.0.12', source_vnet='vnet-test')
+    assert result['status'] == 'Delivered'
+    assert [(hop['vnet'], hop['subnet']) for hop in result['hops']] == [('vnet-test', 'snet-test'), ('vnet-test', 'snet-test')]
+
+
+def test_peering_delivery_stays_in_the_peered_vnet():
+    # The more specific snet-test-small in the unpeered vnet-test must not capture the flow
+    data = with_overlapping_vnet()
+    data['route_tables'][0]['routes'] = []
+    result = TraceIndex(data).trace('10.1.0.4', '10.0.1.70')
+    assert result['status'] == 'Delivered'
+    assert (result['hops'][-1]['vnet'], result['hops'][-1]['subnet']) == ('vnet-hub', 'AzureBastionSubnet')
+
+
+def test_malformed_batch_pairs_are_invalid_entries():
+    results = TraceIndex(hub_and_spoke()).trace_many([['10.1.0.4'], '10.1.0.4', None, ['10.1.0.4', '8.8.8.8'], ['10.1.0.4', '8.8.8.8', 'TCP', 443, None, 'x']])
+    assert [r['status'] for r in results] == ['Invalid', 'Invalid', 'Invalid', 'Internet', 'Invalid']
+
+
+@pytest.mark.parametrize('protocol, port, source_vnet', [
+    ('TCP', None, None), ('TCP', [443], None), ('TCP', True, None), ('TCP', 4.5, None), ('TCP', -5, None), ('TCP', 99999, None),
+    (5, 443, None), (None, 443, None), ('HTTP', 443, None), ('TCP', 443, 5), ('TCP', 443, ['vnet-spoke']),
+])
+def test_malformed_flow_fields_are_invalid(protocol, port, source_vnet):
+    result = TraceIndex(hub_and_spoke()).trace('10.1.0.4', '8.8.8.8', protocol, port, source_vnet)
+    assert result['status'] == 'Invalid'
+
+
+def test_batch_pair_fields_override_the_batch_defaults():
+    data = hub_and_spoke(spoke_nsg=nsg('nsg-app', rule('DenyUdp', 100, 'Deny', protocol='Udp', direction='Outbound')))
+    results = TraceIndex(data).trace_many([['10.1.0.4', '8.8.8.8'], ['10.1.0.4', '8.8.8.8', 'udp'], ['10.1.0.4', '8.8.8.8', 'UDP', '53']], 'TCP', 443)
+    assert [(r['status'], r['port']) for r in results] == [('Internet', 443), ('Denied', 443), ('Denied', '53')]
@@ -0,0 +1,70 @@
+import pytest
+
+from builders import SUB, subnet, vnet
+from prefix_index import PrefixIndex
+
+
+def snapshot(subnet_count=2):
+    data = {'vnets': [vnet('vnet-a', '10.0.0.0/16')],
+            'subnets': [subnet('vnet-a', f'snet-{i}', f'10.0.{i}.0/24') for i in range(subnet_count)],
+            'route_tables': [], 'vnet_gateways': []}
+    return data
+
+
+def names(results):
+    return [entry['name'] for entry in results]
+
+
+def assert_consistent(index):
+    # The sorted start list must match the entries after any mix of inserts and re-sorts
+    assert index._starts == sorted((first, entry_id) for entry_id, (first, _, _, _) in index._entries.items())
+
+
+def test_point_query_returns_containing_prefixes_most_specific_first():
+    index = PrefixIndex(snapshot())
+    assert names(index.search('10.0.1.5')) == ['snet-1', 'vnet-a']
+    assert names(index.search('10.1.0.1')) == []
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('10.0.0.0/23', ['snet-0', 'snet-1', 'vnet-a']),
+    ('10.0.0.128/25', ['snet-0', 'vnet-a']),
+    # snet-1 starts exactly at the last address of the range
+    ('10.0.0.200-10.0.1.0', ['snet-0', 'snet-1', 'vnet-a']),
+    ('10.0.0.200-10.0.0.255', ['snet-0', 'vnet-a']),
+])
+def test_range_queries_return_overlapping_prefixes(query, expected):
+    assert names(PrefixIndex(snapshot()).search(query)) == expected
+
+
+@pytest.mark.parametrize('query', ['', 'vnet-a', '10.0.1.0-10.0.0.0', '10.0.0.0-'])
+def test_unparseable_queries_return_none(query):
+    assert PrefixIndex(snapshot()).search(query) is None
+
+
+@pytest.mark.parametrize('subnet_count', [4, 200])
+def test_update_adds_changes_and_removes_resources(subnet_count):
+    # 200 subnets make the refresh large enough to re-sort in bulk; 4 insert one entry at a time
+    data = snapshot(subnet_count)
+    index = PrefixIndex(data)
+    changed = snapshot(subnet_count)
+    changed['subnets'] = [dict(s, address_prefix=s['address_prefix'].replace('10.0.', '10.2.')) for s in changed['subnets'][:-1]]
+    changed['subnets'].append(subnet('vnet-a', 'snet-new', '10.0.255.0/24'))
+    assert index.update(changed) == subnet_count + 1
+    assert_consistent(index)
+    assert names(index.search('10.0.0.1')) == ['vnet-a']
+    assert names(index.search('10.2.0.1')) == ['snet-0']
+    assert names(index.search('10.0.255.1')) == ['snet-new', 'vnet-a']
+    assert f'snet-{subnet_count - 1}' not in names(index.search('0.0.0.0/0'))
+    assert len(index) == subnet_count + 1
+    assert index.update(changed) == 0
+
+
+def test_routes_without_id_are_indexed_separately():
+    data = snapshot()
+    data['route_tables'] = [{'id': f'{SUB}/routeTables/rt-a', 'name': 'rt-a', 'routes': [
+        {'name': 'to-b', 'address_prefix': '10.8.0.0/16', 'next_hop_type': 'VirtualAppliance', 'next_hop_ip_address': '10.0.0.4'},
+        {'name': 'to-c', 'address_prefix': '10.9.0.0/16', 'next_hop_type': 'VnetLocal'}]}]
+    index = PrefixIndex(data)
+    assert names(index.search('10.8.0.0-10.9.255.255')) == ['to-b', 'to-c']
+    assert [entry['kind'] for entry in index.search('10.0.0.4')] == ['appliance', 'subnet', 'vnet']
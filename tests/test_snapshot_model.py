@@ -0,0 +1,27 @@
+from snapshot_model import compact_snapshot, id_key
+
+RT = '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Network/routeTables/rt-a'
+VNET = '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks/vnet-a'
+RAW = {
+    'route_tables': [{'id': RT, 'name': 'rt-a', 'routes': []}, {'id': RT + '-other', 'name': 'rt-b', 'routes': []}],
+    'subnets': [{'id': VNET + '/subnets/a', 'name': 'a', 'route_table': {'id': RT}, 'address_prefixes': ['10.0.0.0/24']},
+                {'id': VNET + '/subnets/b', 'name': 'b', 'route_table': {'id': RT + '-other'}}],
+}
+
+
+def test_id_key_matches_references_by_handle():
+    snapshot = compact_snapshot(RAW)
+    tables = {id_key(rt): rt['name'] for rt in snapshot['route_tables']}
+    assert [tables[id_key(s, 'route_table')] for s in snapshot['subnets']] == ['rt-a', 'rt-b']
+    assert isinstance(id_key(snapshot['subnets'][0]), int)
+
+
+def test_id_key_on_plain_dicts_uses_strings():
+    assert id_key(RAW['subnets'][0], 'route_table') == RT
+
+
+def test_records_compare_through_to_dict():
+    snapshot = compact_snapshot(RAW)
+    record = snapshot['subnets'][0]
+    assert record.to_dict() == RAW['subnets'][0]
+    assert dict(record) != RAW['subnets'][0]
@@ -0,0 +1,82 @@
+import pytest
+
+from builders import hub_and_spoke
+from snapshot_model import compact_snapshot
+from whatif import WhatIf
+
+
+def shared_route_table_snapshot():
+    # The crawl appends a route table once per subnet that uses it
+    data = hub_and_spoke()
+    route_table = data['route_tables'][0]
+    route_table['subscription_id'] = 'sub'
+    data['subnets'].append(dict(data['subnets'][1], id=data['subnets'][1]['id'].replace('snet-app', 'snet-web'), name='snet-web', address_prefix='10.1.0.64/26'))
+    data['route_tables'].append(dict(route_table))
+    return compact_snapshot(data)
+
+
+@pytest.mark.parametrize('ref', ['rt-spoke', '/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg/providers/Microsoft.Network/routeTables/rt-spoke'])
+def test_shared_route_table_can_be_edited(ref):
+    session = WhatIf(shared_route_table_snapshot())
+    session.apply({'op': 'update_route_table', 'route_table': ref, 'disable_bgp_route_propagation': True})
+    session.apply({'op': 'remove_route', 'route_table': ref, 'name': 'default'})
+    delta = session.delta()
+    assert sorted(subnet['subnet'] for subnet in delta['effective_routes']) == ['snet-app', 'snet-web']
+    assert delta['impacted_subnets'] == 2
+
+
+def test_base_snapshot_is_not_modified():
+    base = shared_route_table_snapshot()
+    before = base.to_dict()
+    session = WhatIf(base).apply_all([{'op': 'remove_route', 'route_table': 'rt-spoke', 'name': 'default'}])
+    assert [rt['routes'] for rt in session['route_tables']] == [[], []]
+    assert base.to_dict() == before
+
+
+def test_disconnecting_a_peering_reports_its_impact():
+    session = WhatIf(compact_snapshot(hub_and_spoke()))
+    session.apply({'op': 'update_peering', 'peering': 'vnet-spoke-to-vnet-hub', 'peering_state': 'Disconnected'})
+    delta = session.delta(pairs=[['10.1.0.4', '8.8.8.8']])
+    assert [issue['description'] for issue in delta['peering_issues']['added']] == ['is Disconnected, not Connected']
+    assert delta['impacted_subnets'] == 1
+    [subnet] = delta['effective_routes']
+    assert (subnet['subnet'], [route['address_prefix'] for route in subnet['removed']]) == ('snet-app', ['10.0.0.0/22'])
+    [trace] = delta['traces']
+    assert (trace['before']['status'], trace['after']['status']) == ('Internet', 'Unknown')
+
+
+def test_peering_gateway_edits_are_validated():
+    session = WhatIf(compact_snapshot(hub_and_spoke()))
+    session.apply({'op': 'update_peering', 'peering': 'vnet-hub-to-vnet-spoke', 'allow_gateway_transit': True, 'use_remote_gateways': True})
+    added = {(issue['peering_name'], issue['description']) for issue in session.delta()['peering_issues']['added']}
+    assert added == {('vnet-hub-to-vnet-spoke', 'both uses remote gateways and allows gateway transit'),
+                     ('vnet-hub-to-vnet-spoke', 'uses remote gateways but the remote VNet has no gateway')}
+
+
+@pytest.mark.parametrize('pairs', ['abc', [['10.1.0.4', '8.8.8.8'], '10.1.0.4 8.8.8.8'], {'pairs': []}])
+def test_pairs_must_be_a_list_of_lists(pairs):
+    with pytest.raises(ValueError, match='pairs'):
+        WhatIf(compact_snapshot(hub_and_spoke())).delta(pairs=pairs)
+
+
+def test_name_shared_by_distinct_route_tables_is_ambiguous():
+    data = hub_and_spoke()
+    data['route_tables'].append(dict(data['route_tables'][0], id=data['route_tables'][0]['id'] + '-2'))
+    with pytest.raises(ValueError, match='matches 2'):
+        WhatIf(compact_snapshot(data)).apply({'op': 'remove_route', 'route_table': 'rt-spoke', 'name': 'default'})
+
+
+@pytest.mark.parametrize('edit', [
+    {'op': 'set_route', 'route': 'x'},
+    {'op': 'set_route', 'route_table': 5, 'route': {}},
+    {'op': 'set_route', 'route_table': 'rt-spoke', 'route': {'name': 1, 'address_prefix': '10.9.0.0/16', 'next_hop_type': 'None'}},
+    {'op': 'remove_route', 'route_table': ['rt-spoke'], 'name': 'default'},
+    {'op': 'remove_route', 'route_table': 'rt-spoke', 'name': None},
+    {'op': 'associate_route_table', 'subnet': 'snet-app', 'route_table': {'id': 'x'}},
+    {'op': 'update_peering', 'peering': {'name': 'x'}, 'allow_forwarded_traffic': False},
+    {'op': 'update_peering', 'peering': 'vnet-hub-to-vnet-spoke', 'peering_state': 3},
+    'remove everything',
+])
+def test_malformed_edits_raise_value_error(edit):
+    with pytest.raises(ValueError):
+        WhatIf(shared_route_table_snapshot()).apply(edit)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare the memory held by the environment snapshot as loaded JSON vs the compact model, and
+what the compact model costs when reading IDs.
+
+A synthetic snapshot is generated from environments/environment_data.json by cloning its first
+VNet and subnet records (with their NSG, route table and NIC references) into <subnets> subnets
+spread over VNets of 10 subnets each, the same shape load_environment() writes.
+
+Usage: memory_benchmark.py [subnets]
+"""
+import copy, gc, json, os, sys, time, tracemalloc
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+from snapshot_model import compact_snapshot, id_key
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+with open(os.path.join(repo_root, 'environments', 'environment_data.json')) as f:
+    sample = json.load(f)
+vnet_template = sample['vnets'][0]
+subnet_template = vnet_template['subnets'][0]
+
+data = {key: [] for key in ('vnets', 'subnets', 'route_tables', 'nsgs', 'peerings', 'vnet_gateways', 'express_route_circuits', 'insights')}
+data['subscriptions'] = sample['subscriptions']
+for v in range((count + 9) // 10):
+    vnet = copy.deepcopy(vnet_template)
+    vnet['id'] = f"{vnet_template['id']}-{v}"
+    vnet['name'] = f"{vnet_template['name']}-{v}"
+    vnet['etag'] = f'W/"{v:08x}-0000-0000-0000-000000000000"'
+    vnet['subnets'] = []
+    for s in range(min(10, count - v * 10)):
+        subnet = copy.deepcopy(subnet_template)
+        subnet['id'] = f"{vnet['id']}/subnets/snet-{s}"
+        subnet['name'] = f'snet-{s}'
+        subnet['etag'] = vnet['etag']
+        subnet['address_prefixes'] = [f'10.{v // 256 % 256}.{v % 256}.{s * 16}/28']
+        subnet['ip_configurations'] = [{'id': f"{vnet_template['id'].rsplit('/', 4)[0]}/networkInterfaces/vm-{v}-{s}-{n}-nic/ipConfigurations/ipconfig1"} for n in range(3)]
+        vnet['subnets'].append(subnet)
+        top = dict(copy.deepcopy(subnet), subscription_id=vnet['subscription_id'], resource_group_name=vnet['resource_group_name'], virtual_network_name=vnet['name'])
+        data['subnets'].append(top)
+    data['vnets'].append(vnet)
+text = json.dumps(data)
+del data, sample
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+raw, raw_size = measure(lambda: json.loads(text))
+compact, compact_size = measure(lambda: compact_snapshot(json.loads(text)))
+assert compact.to_dict() == raw
+
+print(f'{count} subnets ({len(text) / 1e6:.1f} MB of JSON)')
+print(f'loaded JSON      {raw_size / 1e6:8.1f} MB   {raw_size / count:8.0f} bytes/subnet')
+print(f'compact model    {compact_size / 1e6:8.1f} MB   {compact_size / count:8.0f} bytes/subnet')
+print(f'reduction        {raw_size / compact_size:8.1f}x')
+
+def per_read(records, read, rounds=5):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for record in records:
+            read(record)
+    return (time.perf_counter() - started) / (rounds * len(records)) * 1e6
+
+print()
+print('reading a subnet ID (us per read):')
+print(f"  dict['id']       {per_read(raw['subnets'], lambda s: s['id']):8.3f}")
+print(f"  Record['id']     {per_read(compact['subnets'], lambda s: s['id']):8.3f}")
+print(f"  id_key(Record)   {per_read(compact['subnets'], id_key):8.3f}")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Measure routeValidator cold start.
+
+Each run starts a fresh interpreter (like a new App Service worker) and times:
+- import: `import app` (module import + create_app)
+- snapshot: first get_environment_data() call (JSON parse of environments/environment_data.json)
+- heavy: importing the SDKs that are now deferred (azure, pdfkit, tabulate, openai), for comparison
+
+Usage: startup_benchmark.py [runs]
+"""
+import json, os, statistics, subprocess, sys
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.get_environment_data()
+t2 = time.perf_counter()
+heavy = 0.0
+for name in ("azure.identity", "azure.mgmt.network", "azure.mgmt.resource", "pdfkit", "tabulate", "openai"):
+    t = time.perf_counter()
+    try:
+        __import__(name)
+    except Exception:
+        continue
+    heavy += time.perf_counter() - t
+print(json.dumps({"import": t1 - t0, "snapshot": t2 - t1, "heavy": heavy}))
+'''
+
+samples = {"import": [], "snapshot": [], "heavy": []}
+for _ in range(runs):
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=repo_root, capture_output=True, text=True)
+    if out.returncode != 0:
+        print(out.stderr)
+        sys.exit(out.returncode)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    for key, value in result.items():
+        samples[key].append(value * 1000)
+
+print(f'{runs} cold starts (ms)        median      min      max')
+for key, label in (("import", "import app"), ("snapshot", "first snapshot load"), ("heavy", "deferred SDK imports")):
+    values = samples[key]
+    print(f'{label:<24}{statistics.median(values):>10.1f}{min(values):>9.1f}{max(values):>9.1f}')
@@ -0,0 +1,160 @@
+"""Validation checks and insights over the environment data, shared by the web app and the CLI."""
+from nsg_rules import compile_nsg, vnet_service_tags
+
+
+def _nsg_service_tags(subnets, vnets, peerings):
+    """
+    Service tags to compile each NSG with, by lowercase NSG id: the tags of every VNet whose subnets
+    use it, resolved as path_trace does.
+    """
+    vnets_by_id = {(v.get("id") or "").lower(): v for v in vnets}
+    vnet_tags = {}
+    tags_by_nsg = {}
+    for subnet in subnets:
+        nsg_id = ((subnet.get("network_security_group") or {}).get("id") or "").lower()
+        vnet_id = (subnet.get("id") or "").lower().split("/subnets/")[0]
+        if not nsg_id or vnet_id not in vnets_by_id:
+            continue
+        if vnet_id not in vnet_tags:
+            vnet_tags[vnet_id] = vnet_service_tags(vnets_by_id[vnet_id], peerings)
+        tags = tags_by_nsg.setdefault(nsg_id, [])
+        if vnet_tags[vnet_id] not in tags:
+            tags.append(vnet_tags[vnet_id])
+    return tags_by_nsg
+
+
+def validate_routes(subnets, route_tables, nsgs, firewall_ip, vnets=(), peerings=()):
+    """
+    Route next hop checks plus NSG rule anomalies. Pass vnets and peerings so NSG rules using the
+    VirtualNetwork, Internet and AzureLoadBalancer tags are compared by address.
+    """
+    issues = []
+
+    for route_table in route_tables:
+        for route in route_table["routes"]:
+            if route["next_hop_type"] == 'VirtualAppliance' and route.get("next_hop_ip_address") != firewall_ip:
+                issues.append({
+                    "subscription": route_table["subscription_id"],
+                    "route_table_name": route_table["name"],
+                    "route_name": route["name"],
+                    "description": f"has an incorrect next hop IP address: {route.get('next_hop_ip_address')}"
+                })
+
+    # Shadowed rules never apply; redundant rules can be removed without changing what the NSG allows.
+    # The crawl lists an NSG once per subnet it is attached to, so check each NSG once.
+    tags_by_nsg = _nsg_service_tags(subnets, vnets, peerings)
+    unique_nsgs = {}
+    for nsg in nsgs:
+        unique_nsgs.setdefault((nsg.get("id") or "").lower() or id(nsg), nsg)
+    for nsg in unique_nsgs.values():
+        anomalies = []
+        # An NSG with no known VNet is compiled with no tags
+        for service_tags in tags_by_nsg.get((nsg.get("id") or "").lower()) or [None]:
+            for anomaly in compile_nsg(nsg, service_tags).anomalies:
+                if anomaly not in anomalies:
+                    anomalies.append(anomaly)
+        for anomaly in anomalies:
+            issues.append({
+                "subscription": nsg.get("subscription_id"),
+                "nsg_name": anomaly["nsg_name"],
+                "rule_name": anomaly["rule_name"],
+                "description": f"{anomaly['direction']} rule (priority {anomaly['priority']}) is {anomaly['kind']}: rule {anomaly['covered_by']} (priority {anomaly['covered_by_priority']}) covers it"
+            })
+
+    # Add more validation checks as needed
+
+    return issues
+
+
+def validate_peerings(peerings, vnet_gateways):
+    """
+    Check each peering on its own and against its reverse peering, when the reverse is in peerings.
+    Gateway checks only see the gateways in vnet_gateways.
+    """
+    gateway_vnets = set()
+    for gateway in vnet_gateways:
+        for config in gateway.get("ip_configurations") or []:
+            subnet_id = ((config.get("subnet") or {}).get("id") or "").lower()
+            if subnet_id:
+                gateway_vnets.add(subnet_id.split("/subnets/")[0])
+
+    by_vnets = {}
+    for peering in peerings:
+        local = (peering.get("id") or "").lower().split("/virtualnetworkpeerings/")[0]
+        remote = ((peering.get("remote_virtual_network") or {}).get("id") or "").lower()
+        by_vnets[(local, remote)] = peering
+
+    issues = []
+    for (local, remote), peering in by_vnets.items():
+        descriptions = []
+        if peering.get("peering_state") not in (None, "Connected"):
+            descriptions.append(f"is {peering.get('peering_state')}, not Connected")
+        if not peering.get("allow_virtual_network_access"):
+            descriptions.append("does not allow virtual network access")
+        if peering.get("use_remote_gateways"):
+            reverse = by_vnets.get((remote, local))
+            if peering.get("allow_gateway_transit"):
+                descriptions.append("both uses remote gateways and allows gateway transit")
+            if local in gateway_vnets:
+                descriptions.append("uses remote gateways but its own VNet has a gateway")
+            if remote not in gateway_vnets:
+                descriptions.append("uses remote gateways but the remote VNet has no gateway")
+            elif reverse is not None and not reverse.get("allow_gateway_transit"):
+                descriptions.append(f"uses remote gateways but the remote peering {reverse.get('name')} does not allow gateway transit")
+        for description in descriptions:
+            issues.append({
+                "subscription": peering.get("subscription_id"),
+                "virtual_network_name": peering.get("virtual_network_name"),
+                "peering_name": peering.get("name"),
+                "description": description
+            })
+
+    return issues
+
+
+def compute_insights(data):
+    """Return a list of insight dicts per subscription for the /insights page."""
+    insights = []
+    subscriptions = data.get('subscriptions', [])
+    for sub in subscriptions:
+        try:
+            sub_id = sub[0]
+            sub_name = sub[1] if len(sub) > 1 else sub_id
+        except Exception:
+            # If the subscriptions were stored as dicts or strings, fall back
+            if isinstance(sub, dict):
+                sub_id = sub.get('subscription_id') or sub.get('id') or str(sub)
+                sub_name = sub.get('display_name') or sub.get('name') or sub_id
+            else:
+                sub_id = str(sub)
+                sub_name = str(sub)
+
+        total_vnets = len([v for v in data.get('vnets', []) if v.get('subscription_id') == sub_id])
+        total_subnets = len([s for s in data.get('subnets', []) if s.get('subscription_id') == sub_id])
+        total_nsgs = len([n for n in data.get('nsgs', []) if n.get('subscription_id') == sub_id])
+        total_route_tables = len([rt for rt in data.get('route_tables', []) if rt.get('subscription_id') == sub_id])
+        # Estimate subnets with BGP enabled by counting route tables that do not disable BGP propagation
+        subnets_with_bgp = 0
+        for rt in data.get('route_tables', []):
+            if rt.get('subscription_id') == sub_id and not rt.get('disable_bgp_route_propagation'):
+                subnets_with_bgp += 1
+
+        total_peerings = len([p for p in data.get('peerings', []) if p.get('subscription_id') == sub_id])
+        total_vnet_gateways = len([g for g in data.get('vnet_gateways', []) if g.get('subscription_id') == sub_id])
+        total_express = len([e for e in data.get('express_route_circuits', []) if e.get('subscription_id') == sub_id])
+        regions = sorted(list({v.get('location') for v in data.get('vnets', []) if v.get('subscription_id') == sub_id and v.get('location')}))
+
+        insights.append({
+            "Subscription Name": sub_name,
+            "Total VNets": total_vnets,
+            "Total Subnets": total_subnets,
+            "Total NSGs": total_nsgs,
+            "Total Route Tables": total_route_tables,
+            "Subnets with BGP Enabled": subnets_with_bgp,
+            "Total Peerings": total_peerings,
+            "Total VNet Gateways": total_vnet_gateways,
+            "Total ExpressRoute Circuits": total_express,
+            "Regions": ", ".join(regions) if regions else "N/A"
+        })
+
+    return insights
@@ -0,0 +1,337 @@
+"""
+What-if simulation of proposed route, route table and peering changes, without re-crawling Azure.
+
+A WhatIf session is a copy-on-write overlay on the loaded snapshot. The base Snapshot is shared
+and never copied: the session only holds the records it edited, as plain dicts keyed by
+lowercase ARM ID, and reading through it (session['route_tables'], ...) substitutes them on the
+fly. Edits apply to the top-level resource lists (the subnets embedded in each VNet are not
+rewritten).
+
+delta() re-evaluates only what the edits can affect and reports the difference:
+- validate_routes for the edited route tables,
+- validate_peerings for the edited peerings and their reverse peerings,
+- the effective routes of the impacted subnets: subnets using an edited route table, subnets
+  whose route table association changed, and every subnet of a VNet whose peerings changed,
+- optionally, a list of traces run against the base and the what-if state.
+The what-if TraceIndex reuses the base index's lookup tables, and its cached forwarding tables
+for every subnet the edits do not touch.
+"""
+import ipaddress
+import threading
+from collections import ChainMap
+from collections.abc import Mapping, Sequence
+
+from path_trace import TraceIndex, get_trace_index
+from validation import validate_peerings, validate_routes
+
+NEXT_HOP_TYPES = ('VirtualNetworkGateway', 'VnetLocal', 'Internet', 'VirtualAppliance', 'None')
+ROUTE_TABLE_FIELDS = ('disable_bgp_route_propagation',)
+PEERING_FIELDS = ('allow_virtual_network_access', 'allow_forwarded_traffic', 'allow_gateway_transit', 'use_remote_gateways', 'peering_state')
+
+
+def _key(resource_id):
+    return (resource_id or '').lower()
+
+
+def _vnet_id(resource_id):
+    return _key(resource_id).split('/subnets/')[0].split('/virtualnetworkpeerings/')[0]
+
+
+class OverlayList(Sequence):
+    """A base resource list read through the session's edits."""
+
+    def __init__(self, base, edits):
+        self._base = base
+        self._edits = edits
+
+    def __len__(self):
+        return len(self._base)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._edited(self._base[index])
+
+    def __iter__(self):
+        for record in self._base:
+            yield self._edited(record)
+
+    def _edited(self, record):
+        return self._edits.get(_key(record.get('id')), record)
+
+
+class _OverlayTraceIndex(TraceIndex):
+    """TraceIndex over a WhatIf session; unaffected subnets and VNets are served by the base index."""
+
+    def __init__(self, base, session, impacted_subnets, changed_vnets):
+        self.data = session
+        self.base = base
+        self.vnets = base.vnets
+        self.nsgs = base.nsgs
+        self.gateways = base.gateways
+        self.route_tables = ChainMap(session.edits['route_tables'], base.route_tables)
+        self.subnets = ChainMap(session.edits['subnets'], base.subnets)
+        # The prefix tables hold subnet keys, so lookups resolve to edited subnets through self.subnets
+        self.subnet_index = base.subnet_index
+        self.vnet_subnets = base.vnet_subnets
+        peerings = {}
+        for vnet_id in changed_vnets:
+            peerings[vnet_id] = [session.edits['peerings'].get(_key(p.get('id')), p) for p in base.peerings.get(vnet_id, [])]
+        self.peerings = ChainMap(peerings, base.peerings)
+        self.peerings_by_id = ChainMap(session.edits['peerings'], base.peerings_by_id)
+        self.impacted_subnets = impacted_subnets
+        self.changed_vnets = changed_vnets
+        self._forwarding = {}
+        self._tags = {}
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def forwarding_table(self, subnet):
+        if _key(subnet.get('id')) not in self.impacted_subnets:
+            return self.base.forwarding_table(subnet)
+        return super().forwarding_table(subnet)
+
+    def service_tags(self, vnet_id):
+        if vnet_id not in self.changed_vnets:
+            return self.base.service_tags(vnet_id)
+        return super().service_tags(vnet_id)
+
+
+def _diff(before, after):
+    return {
+        'added': [item for item in after if item not in before],
+        'resolved': [item for item in before if item not in after],
+    }
+
+
+def _route_changes(before, after):
+    """Compare two effective route lists by address prefix."""
+    before = {route['address_prefix']: route for route in before}
+    after = {route['address_prefix']: route for route in after}
+    return {
+        'added': [route for prefix, route in after.items() if prefix not in before],
+        'removed': [route for prefix, route in before.items() if prefix not in after],
+        'changed': [{'address_prefix': prefix, 'before': before[prefix], 'after': route}
+                    for prefix, route in after.items() if prefix in before and before[prefix] != route],
+    }
+
+
+class WhatIf(Mapping):
+    """Copy-on-write overlay of proposed edits on a snapshot. Reads like the snapshot it wraps."""
+
+    def __init__(self, base):
+        self.base = base
+        self.edits = {'route_tables': {}, 'subnets': {}, 'peerings': {}}   # lowercase id -> edited record
+        self.applied = []
+        self._index = None
+
+    def __getitem__(self, key):
+        value = self.base[key]
+        if self.edits.get(key):
+            return OverlayList(value, self.edits[key])
+        return value
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+    def _find(self, key, ref):
+        """Current record for an ARM ID or a unique name."""
+        kind = key[:-1].replace('_', ' ')
+        if not isinstance(ref, str) or not ref.strip():
+            raise ValueError(f'A {kind} id or name (a string) is required')
+        ref = ref.strip()
+        edited = self.edits[key].get(_key(ref))
+        if edited is not None:
+            return edited
+        # The crawl lists a route table or NSG once per subnet using it, so match distinct IDs
+        matches = {}
+        for record in self.base.get(key, []):
+            if _key(record.get('id')) == _key(ref):
+                matches.setdefault(_key(record.get('id')), record)
+        if not matches:
+            for record in self.base.get(key, []):
+                if record.get('name') == ref:
+                    matches.setdefault(_key(record.get('id')), record)
+        if len(matches) != 1:
+            raise ValueError(f'{ref!r} matches {len(matches)} {key.replace("_", " ")}, expected one (use the id)')
+        resource_id, record = next(iter(matches.items()))
+        return self.edits[key].get(resource_id, record)
+
+    def _write(self, key, record, changes):
+        edited = dict(record)
+        edited.update(changes)
+        self.edits[key][_key(edited.get('id'))] = edited
+        self._index = None
+
+    def set_route(self, route_table, route):
+        """Add a UDR to a route table, or replace the route with the same name."""
+        route_table = self._find('route_tables', route_table)
+        for field in ('name', 'address_prefix', 'next_hop_type', 'next_hop_ip_address'):
+            if route.get(field) is not None and not isinstance(route[field], str):
+                raise ValueError(f'Route {field} must be a string')
+        name = (route.get('name') or '').strip()
+        prefix = (route.get('address_prefix') or '').strip()
+        next_hop_type = route.get('next_hop_type')
+        next_hop_ip_address = route.get('next_hop_ip_address') or None
+        if not name:
+            raise ValueError('A route name is required')
+        try:
+            ipaddress.ip_network(prefix, strict=False)
+        except ValueError:
+            raise ValueError(f'{prefix!r} is not a valid address prefix')
+        if next_hop_type not in NEXT_HOP_TYPES:
+            raise ValueError(f'next_hop_type must be one of {", ".join(NEXT_HOP_TYPES)}')
+        if next_hop_type == 'VirtualAppliance':
+            try:
+                ipaddress.ip_address(next_hop_ip_address or '')
+            except ValueError:
+                raise ValueError('A VirtualAppliance route needs a valid next_hop_ip_address')
+        else:
+            next_hop_ip_address = None
+
+        routes = list(route_table.get('routes') or [])
+        changes = {'address_prefix': prefix, 'next_hop_type': next_hop_type, 'next_hop_ip_address': next_hop_ip_address}
+        for i, existing in enumerate(routes):
+            if existing.get('name') == name:
+                routes[i] = dict(existing, **changes)
+                break
+        else:
+            routes.append(dict({'id': f"{route_table.get('id')}/routes/{name}", 'name': name}, **changes))
+        self._write('route_tables', route_table, {'routes': routes})
+
+    def remove_route(self, route_table, name):
+        route_table = self._find('route_tables', route_table)
+        routes = [route for route in route_table.get('routes') or [] if route.get('name') != name]
+        if len(routes) == len(route_table.get('routes') or []):
+            raise ValueError(f"Route table {route_table.get('name')} has no route {name!r}")
+        self._write('route_tables', route_table, {'routes': routes})
+
+    def update_route_table(self, route_table, **fields):
+        for field in fields:
+            if field not in ROUTE_TABLE_FIELDS:
+                raise ValueError(f'Route table field {field!r} cannot be edited (allowed: {", ".join(ROUTE_TABLE_FIELDS)})')
+        self._write('route_tables', self._find('route_tables', route_table), {field: bool(value) for field, value in fields.items()})
+
+    def associate_route_table(self, subnet, route_table):
+        """Associate a route table with a subnet; route_table None removes the association."""
+        subnet = self._find('subnets', subnet)
+        reference = {'id': self._find('route_tables', route_table).get('id')} if route_table else None
+        self._write('subnets', subnet, {'route_table': reference})
+
+    def update_peering(self, peering, **fields):
+        for field in fields:
+            if field not in PEERING_FIELDS:
+                raise ValueError(f'Peering field {field!r} cannot be edited (allowed: {", ".join(PEERING_FIELDS)})')
+        if not isinstance(fields.get('peering_state', ''), str):
+            raise ValueError('peering_state must be a string')
+        changes = {field: value if field == 'peering_state' else bool(value) for field, value in fields.items()}
+        self._write('peerings', self._find('peerings', peering), changes)
+
+    def apply(self, edit):
+        """
+        Apply one edit given as a dict, e.g. from JSON:
+            {"op": "set_route", "route_table": ID or name, "route": {"name", "address_prefix", "next_hop_type", "next_hop_ip_address"}}
+            {"op": "remove_route", "route_table": ..., "name": ...}
+            {"op": "update_route_table", "route_table": ..., "disable_bgp_route_propagation": true}
+            {"op": "associate_route_table", "subnet": ..., "route_table": ... or null}
+            {"op": "update_peering", "peering": ..., "allow_forwarded_traffic": false, ...}
+        """
+        if not isinstance(edit, dict):
+            raise ValueError('Each edit must be an object with an "op"')
+        op = edit.get('op')
+        if op == 'set_route' and not isinstance(edit.get('route'), dict):
+            raise ValueError('set_route needs a "route" object')
+        if op == 'remove_route' and not isinstance(edit.get('name'), str):
+            raise ValueError('remove_route needs a route "name"')
+        if op == 'associate_route_table' and edit.get('route_table') is not None and not isinstance(edit.get('route_table'), str):
+            raise ValueError('route_table must be a route table id or name, or null')
+        fields = {k: v for k, v in edit.items() if k not in ('op', 'route_table', 'peering')}
+        if op == 'set_route':
+            self.set_route(edit.get('route_table'), edit.get('route') or {})
+        elif op == 'remove_route':
+            self.remove_route(edit.get('route_table'), edit.get('name'))
+        elif op == 'update_route_table':
+            self.update_route_table(edit.get('route_table'), **fields)
+        elif op == 'associate_route_table':
+            self.associate_route_table(edit.get('subnet'), edit.get('route_table'))
+        elif op == 'update_peering':
+            self.update_peering(edit.get('peering'), **fields)
+        else:
+            raise ValueError(f'Unknown edit op {op!r}')
+        self.applied.append(edit)
+
+    def apply_all(self, edits):
+        for edit in edits:
+            self.apply(edit)
+        return self
+
+    def _impact(self, base_index):
+        """Subnets whose forwarding tables and VNets whose peerings the edits change."""
+        changed_vnets = {_vnet_id(peering_id) for peering_id in self.edits['peerings']}
+        edited_tables = set(self.edits['route_tables'])
+        impacted = set(self.edits['subnets'])
+        for subnet_id, subnet in base_index.subnets.items():
+            subnet = self.edits['subnets'].get(subnet_id, subnet)
+            if _key((subnet.get('route_table') or {}).get('id')) in edited_tables or _vnet_id(subnet_id) in changed_vnets:
+                impacted.add(subnet_id)
+        return impacted, changed_vnets
+
+    def trace_index(self):
+        """TraceIndex of the what-if state, built on first use after an edit."""
+        index = self._index
+        if index is None:
+            base_index = get_trace_index(self.base)
+            impacted, changed_vnets = self._impact(base_index)
+            index = self._index = _OverlayTraceIndex(base_index, self, impacted, changed_vnets)
+        return index
+
+    def delta(self, firewall_ip=None, pairs=None, protocol='TCP', port=443):
+        """
+        Re-run the validations the edits affect and return what changed against the base snapshot.
+        pairs are traced before and after as by TraceIndex.trace_many; raises ValueError unless they are a list of lists.
+        """
+        if pairs is not None and (not isinstance(pairs, list) or not all(isinstance(pair, (list, tuple)) for pair in pairs)):
+            raise ValueError('pairs must be a list of [source, destination, ...] lists')
+        index = self.trace_index()
+        base_index = index.base
+
+        route_issues_before, route_issues_after = [], []
+        for route_table_id, route_table in self.edits['route_tables'].items():
+            route_issues_before += validate_routes([], [base_index.route_tables[route_table_id]], [], firewall_ip)
+            route_issues_after += validate_routes([], [route_table], [], firewall_ip)
+
+        # A peering's gateway checks depend on its reverse peering, so check both sides
+        peering_ids = set(self.edits['peerings'])
+        for peering_id in self.edits['peerings']:
+            remote_id = _key((base_index.peerings_by_id[peering_id].get('remote_virtual_network') or {}).get('id'))
+            for reverse in base_index.peerings.get(remote_id, []):
+                if _key((reverse.get('remote_virtual_network') or {}).get('id')) == _vnet_id(peering_id):
+                    peering_ids.add(_key(reverse.get('id')))
+        gateways = self.base.get('vnet_gateways', [])
+        peering_issues_before = validate_peerings([base_index.peerings_by_id[i] for i in peering_ids], gateways)
+        peering_issues_after = validate_peerings([self.edits['peerings'].get(i, base_index.peerings_by_id[i]) for i in peering_ids], gateways)
+
+        effective_routes = []
+        for subnet_id in sorted(index.impacted_subnets):
+            base_subnet = base_index.subnets.get(subnet_id)
+            if base_subnet is None:
+                continue
+            changes = _route_changes(base_index.effective_routes(base_subnet), index.effective_routes(index.subnets[subnet_id]))
+            if any(changes.values()):
+                effective_routes.append(dict({'subnet': base_subnet.get('name'), 'vnet': base_subnet.get('virtual_network_name'), 'id': base_subnet.get('id')}, **changes))
+
+        traces = []
+        for before, after in zip(base_index.trace_many(pairs or [], protocol, port), index.trace_many(pairs or [], protocol, port)):
+            traces.append({'source': before['source'], 'destination': before['destination'], 'before': before, 'after': after, 'changed': before != after})
+
+        return {
+            'edits': len(self.applied),
+            'impacted_subnets': len(index.impacted_subnets),
+            'route_issues': _diff(route_issues_before, route_issues_after),
+            'peering_issues': _diff(peering_issues_before, peering_issues_after),
+            'effective_routes': effective_routes,
+            'traces': traces,
+        }